@@ -1,113 +1,107 @@
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt 
-import plotly.graph_objects as go
-import random
-import json
-
-from .preprocessing import join_box
-from .sorting import sort_boxes
+import os
+from collections import deque
+from contextlib import closing
+from time import perf_counter
+from itertools import count
+from functools import partial
+
+from .preprocessing import join_box, compile_boxes
+from .sorting import orient_boxes, sort_table
 from .packing import load_boxes
 from .postprocessing import separate_boxes
-
-
-def show_boxes(solutions):
-    fig = go.Figure()
-    for id, box_solution in solutions:
-            x, y, z = box_solution[0:3]
-            length, width, height = box_solution[3:6]
-                
-            hover_text = f'{id}<br>Dimensions: {length}x{width}x{height}<br>Position: ({x}, {y}, {z})'
-            fig.add_trace(go.Mesh3d(
-                x=[x, x + length, x + length, x, x, x + length, x + length, x],
-                y=[y, y, y + width, y + width, y, y, y + width, y + width],
-                z=[z, z, z, z, z + height, z + height, z + height, z + height],
-                i= [7, 0, 0, 0, 4, 4, 6, 1, 4, 0, 3, 6],
-                j= [3, 4, 1, 2, 5, 6, 5, 2, 0, 1, 6, 3],
-                k= [0, 7, 2, 3, 6, 7, 1, 6, 5, 5, 7, 2],
-                name=f'{id}',
-                hovertext=hover_text                  
-                ))
-                
-            # Set layout properties
-            fig.update_layout(
-                scene=dict(
-                    xaxis_title='X',
-                    yaxis_title='Y',
-                    zaxis_title='Z',
-                    aspectmode='data')
-                )
-        
-
-    # Show the interactive plot
-    fig.show(renderer = 'browser')
-
-def RCH(container_dimensions, df, hmap, load_type, viaje):
-    # Get provided container dimensions
+from .engine import run_restarts
+from .stopping import StoppingPolicy, objective
+from .archive import SolutionArchive
+from .instrumentation import Recorder
+from .local_search import Candidate, parse_seed
+from .loaded import LoadedContainer, state_path
+from .memo import RestartMemo
+from .prefix import PrefixCache
+from .container import MAXI_45
+
+
+def decode(table, container_width, seed, recorder=None):
+    # Orientation and order of the boxes of a restart, every random number comes from the generator of its seed
+    rng = np.random.default_rng(seed)
+
+    # One random number per box for the orientation and one per pair of boxes for the swaps in the sorting
+    n = len(table)
+    draws = rng.random(n + n // 2)
+
+    # Boxes that fill the width of the container have a fixed orientation, the rest of boxes are given a random orientation
+    if recorder is not None:
+        start = perf_counter()
+    length, width, priority = orient_boxes(table, container_width, draws[:n])
+    if recorder is not None:
+        recorder.add_time('orientation', start)
+        start = perf_counter()
+
+    # Sort the boxes by height and length and swap some of the adjacent boxes
+    order = sort_table(table, length, priority, draws[n:])
+    if recorder is not None:
+        recorder.add_time('sort_boxes', start)
+
+    return order, length, width, priority
+
+def RCH(container_dimensions, table, hmap, load_type, viaje, instrument=False, seed=None, state=None):
+    # With instrument=True the restart is measured with a Recorder that is returned after the PPs
+    # The same seed always gives the same solution
+    # With load type 4 the boxes are loaded on top of state, a LoadedContainer
+    recorder = Recorder() if instrument else None
+
+    # The boxes are compiled once per trip, we also accept the preprocessed DataFrame
+    if isinstance(table, pd.DataFrame):
+        table = compile_boxes(table, container_dimensions)
+
+    order, length, width, priority = decode(table, container_dimensions[1], seed, recorder)
+
+    return evaluate(container_dimensions, table, hmap, load_type, viaje, order, length, width, priority, recorder, state)
+
+def evaluate(container_dimensions, table, hmap, load_type, viaje, order, length, width, priority, recorder=None,
+             state=None, prefix=None):
+    # Load the boxes of the table in the given order and orientation and score the solution
+    # With a PrefixCache the packing starts from the state saved after the longest prefix it shares with a previous one
     container_length, container_width, container_height = container_dimensions
 
-    # Create boxes dictionary from DataFrame
-    boxes = {}
-    for i in range(len(df)):
-
-        box_id = df['Partida'][i]
-        box_group = df['Expedicion'][i]
-        r = random.random()
-
-        fixed = 0
-        id = (box_id, box_group)
-
-        # If we can fill the width of the container in one of the given directions we choose it.
-        if int(df['LargoCm'][i]) > container_width or 0 <= (container_width - int(df['AnchoCm'][i])) < 8:
-            boxes[id] = [int(df['LargoCm'][i]), int(df['AnchoCm'][i]), int(df['AltoCm'][i]), 2, int(df['Remontable'][i])]
-            fixed = 1
-
-        if int(df['AnchoCm'][i]) > container_width or 0 <= (container_width - int(df['LargoCm'][i])) < 8:
-            boxes[id] = [int(df['AnchoCm'][i]), int(df['LargoCm'][i]), int(df['AltoCm'][i]), 2, int(df['Remontable'][i])]
-            fixed = 1
-
-        # The rest of boxes are given a random orientation
-        if fixed == 0:
-                
-            if r < 0.5:
-                boxes[id] = [int(df['AnchoCm'][i]), int(df['LargoCm'][i]), int(df['AltoCm'][i]), 2, int(df['Remontable'][i])]
-                    
-            else:
-                boxes[id] = [int(df['LargoCm'][i]), int(df['AnchoCm'][i]), int(df['AltoCm'][i]), 2, int(df['Remontable'][i])]
-    
-    # If the box fills the container width we give it priority 1
-    for id, box in boxes.items():
-        if container_width - box[1] < 15:
-            box[3] = 1
-
-    # Sort the boxes by priority and volume (length * width * height)
-    sorted_boxes = sort_boxes(boxes)
+    if recorder is not None:
+        start = perf_counter()
+    sorted_boxes = table.boxes(order, length, width, priority)
+    if recorder is not None:
+        recorder.add_time('sort_boxes', start)
 
     # Packing step of the algorithm where the solution is generated
-    solution, not_loaded, PPs = load_boxes(sorted_boxes, container_dimensions, load_type, viaje)
+    solution, not_loaded, PPs = load_boxes(sorted_boxes, container_dimensions, load_type, viaje, recorder, state, prefix)
 
     solution = [x for x in solution if x != False]
 
-    # Separate the boxes for visualization 
+    # Separate the boxes for visualization
+    if recorder is not None:
+        recorder.count('placed', len(solution))
+        start = perf_counter()
     final_solution = separate_boxes(solution, hmap)
-    final_solution = list(dict.fromkeys(final_solution))
+    if recorder is not None:
+        recorder.add_time('separate_boxes', start)
+        start = perf_counter()
 
     used_volume = 0
     used_floor = 0
-    
-    # Calculate the total floor area and volume used in the container
+
+    # X_axis represents the length of all of the loaded boxes (last box + last box length), 0 if no box fits
+    x_axis = final_solution[0][1][0] + final_solution[0][1][3] if final_solution else 0
+
+    # Calculate the total floor area and volume used in the container in the same pass
     for id, box in final_solution:
+        box_floor = box[3]*abs(box[4])
         if box[2] == 0:
-            box_floor = box[3]*abs(box[4])
             used_floor += box_floor
 
-        box_volume = box[3]*abs(box[4])*box[5]
-        used_volume += box_volume
+        used_volume += box_floor*box[5]
 
-    # X_axis represents the length of all of the loaded boxes (last box + last box length)
-    last_box = max(final_solution, key= lambda x: x[1][0] + x[1][3])[1]
-    x_axis = last_box[0] + last_box[3]
+        end = box[0] + box[3]
+        if end > x_axis:
+            x_axis = end
 
     # Pctg_floor is the percentage of the area of the container floor that is used
     pctg_floor = used_floor/(container_length*container_width) * 100
@@ -115,70 +109,282 @@ def RCH(container_dimensions, df, hmap, load_type, viaje):
     # Pctg_volume represents the percentage of the total volume that is used
     pctg_volume = used_volume/(container_length*container_width*container_height) * 100
 
+    if recorder is not None:
+        recorder.add_time('scoring', start)
+        recorder.count('restarts')
+        recorder.count('boxes', len(order))
+        recorder.count('not_loaded', len(not_loaded))
+
+        return (pctg_volume, pctg_floor, x_axis, final_solution, not_loaded, PPs, recorder)
+
     return (pctg_volume, pctg_floor, x_axis, final_solution, not_loaded, PPs)
 
-def get_volumes(viaje, load_type=1, file_path=None):
+def preprocess_trip(source, container_dimensions, cache=None):
+    # Read the trip and combine its boxes, if the trip is already in the cache we skip reading the excel and join_box
+    # The source is the path of the input excel or a DataFrame with the partidas of the trip
+    if cache is not None:
+        key = cache.key(source, container_dimensions)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Read the input excel, join_box modifies the DataFrame so we don't use the one we are given
+    if isinstance(source, pd.DataFrame):
+        df = source.copy()
+    else:
+        df = pd.read_excel(source)
+
+    # Preprocess the boxes to generate bigger boxes, we also generate a hmap to be able to separate the boxes later
+    df, hmap = join_box(df, container_dimensions)
+
+    # Compile the boxes into arrays that are reused by every restart
+    table = compile_boxes(df, container_dimensions)
+
+    if cache is not None:
+        cache.put(key, df, hmap, table)
+
+    return df, hmap, table
+
+def restart_scores(container_dimensions, table, hmap, load_type, viaje, instrument=False, seed=None, state=None,
+                   prefix=None):
+    # Restart of search that only returns the scores and the number of boxes not loaded (and the Recorder), the
+    # solution can be regenerated from the seed
+    # search decodes the seeds itself to find the duplicates, seed is the decoded restart as a Candidate or None for
+    # a duplicate, whose scores search takes from its memo
+    if seed is None:
+        return None
+
+    recorder = Recorder() if instrument else None
+    result = evaluate(container_dimensions, table, hmap, load_type, viaje, seed.order, seed.length, seed.width,
+                      seed.priority, recorder, state, prefix)
+
+    return result[0:3] + (len(result[4]),) + result[6:]
+
+def regenerate(container_dimensions, table, hmap, load_type, viaje, seed, state=None, prefix=None):
+    # Solution of an entry of the archive, seed is the seed of a restart or a Candidate of the local search
+    if isinstance(seed, Candidate):
+        return evaluate(container_dimensions, table, hmap, load_type, viaje, seed.order, seed.length, seed.width,
+                        seed.priority, state=state, prefix=prefix)
+
+    return RCH(container_dimensions, table, hmap, load_type, viaje, seed=seed, state=state)
+
+def search(container_dimensions, table, hmap, load_type, viaje, n_workers=1, seeds=None, stopping=None, archive=None,
+           recorder=None, local_search=None, state=None, memo=None, prefix=None, results=None):
+    """
+    Restart loop of a preprocessed trip followed by the local search, the best solutions are kept in the archive.
+
+    Parameters:
+        container_dimensions (list): Dimensions of the container.
+        table (BoxTable), hmap (dict): Preprocessed trip.
+        load_type (int): Load type, its objective ranks the solutions.
+        viaje (str): Trip code.
+        n_workers (int): Number of worker processes of the restarts.
+        seeds (iterable): One seed per restart, by default as many as the maximum restarts of the stopping policy.
+        stopping (StoppingPolicy): Decides when the restarts stop.
+        archive (SolutionArchive): Archive the restarts and the improvements of the local search are added to.
+        recorder (Recorder): If given the timers and counters of every restart are added to it.
+        local_search (LocalSearch): Improvement stage after the restarts, None to skip it.
+        state (LoadedContainer): Boxes already in the container for load type 4.
+        memo (RestartMemo): Memo of the scores of the restarts, by default a new one, RestartMemo(0) disables it.
+        prefix (PrefixCache): Packing states shared by the restarts and the moves of the local search, by default
+            a new one, PrefixCache(0) disables it.
+        results (list): If given, the scores and the number of boxes not loaded of every restart are appended to it.
+
+    Returns:
+        SolutionArchive: The archive, stopping holds the number of restarts and the stop reason.
+    """
+    if stopping is None:
+        stopping = StoppingPolicy()
+
+    if archive is None:
+        archive = SolutionArchive()
+
+    if memo is None:
+        memo = RestartMemo()
+
+    if prefix is None:
+        prefix = PrefixCache()
+
+    # If only distinct restarts count we don't know how many seeds we need
+    if seeds is None:
+        seeds = count() if stopping.max_restarts is None or stopping.distinct else range(stopping.max_restarts)
+
+    # For each restart we only store its scores and its seed in the archive, the duplicates are stored as well so
+    # the archive is the same with or without the memo. The state is sent to each worker once
+    # The seeds are decoded here and the memo is only kept in this process, a restart with the signature of an
+    # earlier seed is not sent to the workers, so the duplicates only depend on the seeds and not on the number of
+    # workers. The memo holds the entry of a restart before it finishes, the entry is filled when its scores arrive
+    # and as the results come in the order of the seeds it is always filled before its duplicates are read
+    memo.start(table, hmap)
+    prefix.start()
+    stopping.start(load_type, local_search.share if local_search is not None else 0.0)
+    pending = deque()
+
+    def tasks():
+        for seed in seeds:
+            order, length, width, priority = decode(table, container_dimensions[1], seed, recorder)
+            signature = memo.signature(order, length)
+            entry = memo.get(signature)
+            if entry is None:
+                entry = [None]
+                memo.put(signature, entry)
+                pending.append((seed, entry, False))
+                yield Candidate(order, length, width, priority, seed)
+            else:
+                pending.append((seed, entry, True))
+                yield None
+
+    args = (container_dimensions, table, hmap, load_type, viaje, recorder is not None)
+    restart = partial(restart_scores, state=state, prefix=prefix)
+    with closing(run_restarts(restart, args, tasks(), n_workers)) as restarts:
+        for _, result in restarts:
+            seed, entry, duplicate = pending.popleft()
+            if not duplicate:
+                entry[0] = result[0:4]
+                if recorder is not None:
+                    recorder.merge(result[4])
+
+            scores = entry[0][0:3]
+            archive.add(scores, seed)
+            if results is not None:
+                results.append(entry[0])
+
+            if recorder is not None:
+                recorder.count('memo_hits' if duplicate else 'memo_misses')
+
+            if stopping.update(scores, duplicate):
+                break
+
+    # The local search starts from the best restarts and adds its improvements to the archive
+    if local_search is not None:
+        def evaluate_candidate(candidate):
+            return regenerate(container_dimensions, table, hmap, load_type, viaje, candidate, state, prefix)
+
+        starts = [Candidate(*decode(table, container_dimensions[1], seed), seed)
+                  for scores, seed in archive.best(load_type)[:local_search.starts]]
+        improvements = local_search.run(evaluate_candidate, table, container_dimensions[1], starts,
+                                        objective(load_type), stopping.remaining, recorder)
+        for scores, candidate in improvements:
+            archive.add(scores, candidate, restart=False)
+
+    stopping.finish()
+
+    return archive
+
+def replay_solution(viaje, seed, load_type=1, file_path=None, df=None, store=None, cache=None, container=MAXI_45,
+                    state=None):
+    # Regenerate the solution of an entry of get_volumes, it returns the same tuple as RCH
+    # The seed is the seed of a restart or the key of a Candidate of the local search (BestVolumeSeed of the batch)
+    # Load type 4 needs the LoadedContainer the solution was loaded on top of
+    container_dimensions = container
+
+    if df is None and store is not None:
+        df = store.trip(viaje)
+
+    df, hmap, table = preprocess_trip(file_path if df is None else df, container_dimensions, cache)
+    seed = parse_seed(seed, table, container_dimensions[1])
+
+    return regenerate(container_dimensions, table, hmap, load_type, viaje, seed, state)
+
+def get_volumes(viaje, load_type=1, file_path=None, n_workers=1, seeds=None, stopping=None, archive=None, cache=None, df=None, store=None,
+                output_dir=None, render=None, recorder=None,
+                local_search=None, state=None, memo=None, prefix=None, container=MAXI_45):
     # 4 types of load type:
     #   1. Maximize volume and floor
     #   2. Minimize X axis 
     #   3. Maximize only floor
     #   4. Resume loading from previous solution
-
-    # Set the container dimensions
-    container_dimensions = [1350, 246, 259]
-
-    # Read the input excel
-    df = pd.read_excel(file_path)
-    
-    # Preprocess the boxes to generate bigger boxes, we also generate a hmap to be able to separate the boxes later
-    df, hmap = join_box(df, container_dimensions)
-
-    # For each solution we store the solution and the boxes not loaded in a dictionary with the scores as the key
-    all_solutions = {}
-    for i in range(15000):
-
-        pctg_volume, pctg_floor, x_axis, solution, not_loaded, PPs = RCH(container_dimensions, df, hmap, load_type, viaje)
-        all_solutions[(pctg_volume, pctg_floor, x_axis)] = (solution, not_loaded, PPs)
-
-    # We sort the keys depending on which score we want to minimize/maximize
-    volume_sorted_keys = sorted(all_solutions.keys(), key=lambda x: (x[0], x[1]), reverse=True)
-    floor_sorted_keys = sorted(all_solutions.keys(), key=lambda x: (x[1], x[0]), reverse=True)
-    x_sorted_keys = sorted(all_solutions.keys(), key=lambda x: (-x[2], x[1]), reverse=True)
-
-    # Choose which sorted keys we want to use based on the load type
-    if load_type == 1:
-        sorted_keys = volume_sorted_keys
-    elif load_type == 2:
-        sorted_keys = x_sorted_keys
-    elif load_type == 3:
-        sorted_keys = floor_sorted_keys 
-    elif load_type ==4:
-        sorted_keys = x_sorted_keys
-
-    # We visualize the best solutions based on whichever score we prefer
-    for i in range(5):
-        show_boxes(all_solutions[sorted_keys[i]][0])
-        print('Scores: ', sorted_keys[i])
-        print('Not loaded: ', len(all_solutions[sorted_keys[i]][1]))
-    
-    # Calculate the average loaded volume
-    all_pctg = [x[0] for x in floor_sorted_keys]
-    avg_pctg = np.mean(all_pctg)
+    # The restarts are spread over n_workers processes, each restart uses one of the seeds so the same seeds
+    # always give the same solutions whatever the number of workers
+    # The stopping policy decides when we stop generating solutions (restarts, time budget or no improvement)
+    # The archive keeps the seeds of the best restarts of each objective and of the non-dominated front as the restarts
+    # finish, the solutions of the best restarts are regenerated from their seeds at the end
+    # With a TripCache the preprocessed trip is stored on disk and reused the next time the same trip is planned
+    # The partidas are read from file_path, or given directly as a DataFrame (df) or taken from a TripStore (store)
+    # With output_dir the boxes not loaded are saved in their own file for the trip instead of not_loaded.xlsx
+    # The best solutions are only drawn if render is given: 'browser' opens them in the browser, 'html' and 'json'
+    # save them as files in output_dir (soluciones by default)
+    # With a Recorder the timers and counters of every restart are added to it, recorder.report() gives them per trip
+    # With a LocalSearch the best restarts are improved after the restart loop, it gets its share of the time budget
+    # Load type 4 starts from the LoadedContainer given as state, or from the one saved by load type 2 for the trip
+    # in output_dir (soluciones by default), where load type 2 saves it
+    # Restarts that load the same boxes in the same order and orientation as a previous one are taken from a
+    # RestartMemo instead of loading them again, and the packing of each restart starts from the state saved in a
+    # PrefixCache after the longest prefix of boxes it shares with a previous restart
+
+    if stopping is None:
+        stopping = StoppingPolicy()
+
+    if archive is None:
+        archive = SolutionArchive()
+
+    # Set the container dimensions, a ContainerSpec or a list [length, width, height]
+    container_dimensions = container
+
+    # Read and preprocess the trip
+    if df is None and store is not None:
+        df = store.trip(viaje)
+
+    df, hmap, table = preprocess_trip(file_path if df is None else df, container_dimensions, cache)
+
+    # The first load of the container is only read once, not in every restart
+    if load_type == 4 and state is None:
+        state = LoadedContainer.from_json(state_path(viaje, output_dir))
+
+    search(container_dimensions, table, hmap, load_type, viaje, n_workers, seeds, stopping, archive, recorder,
+           local_search, state, memo, prefix)
+
+    print('Stop reason: ', stopping.stop_reason)
+    print('Restarts: ', stopping.restarts, f'({stopping.elapsed:.1f} s)')
+    print('Duplicates: ', stopping.duplicates, f'({stopping.duplicate_rate:.0%})')
+    if local_search is not None:
+        print('Local search: ', local_search.moves, 'moves,', local_search.improvements, 'improvements')
+
+    # The solutions of the best restarts are generated again from their seeds, each seed is only replayed once
+    replays = {}
+    def replay(seed):
+        if seed not in replays:
+            replays[seed] = regenerate(container_dimensions, table, hmap, load_type, viaje, seed, state)
+        return replays[seed]
+
+    # Best solutions for each score we want to minimize/maximize
+    best_volume = archive.best(1)[0]
+    best_floor = archive.best(3)[0]
+
+    # We visualize the best solutions based on whichever score we prefer, plotly is only imported if we draw them
+    if render is not None:
+        from .render import show_boxes, export_solution
+
+    for rank, (scores, seed) in enumerate(archive.best(load_type)):
+        solution, not_loaded, PPs = replay(seed)[3:6]
+        if render == 'browser':
+            show_boxes(solution)
+        elif render in ('html', 'json'):
+            path = os.path.join(output_dir or 'soluciones', f'solution_{viaje}_{rank}.{render}')
+            export_solution(solution, path, title=f'{viaje} {scores}')
+        elif render is not None:
+            raise ValueError(f"render has to be None, 'browser', 'html' or 'json', not {render!r}")
+        print('Scores: ', scores, 'Seed: ', seed)
+        print('Not loaded: ', len(not_loaded))
+
+    # Average loaded volume of all the restarts
+    avg_pctg = archive.mean_volume
 
     # Create an excel file with the boxes that haven't been loaded
-    not_loaded_best = pd.DataFrame.from_dict(all_solutions[volume_sorted_keys[0]][1], orient='index', columns=['LargoCm', 'AnchoCm', 'AltoCm', 'Prioridad', 'Remontable'])
+    not_loaded_best = pd.DataFrame.from_dict(replay(best_volume[1])[4], orient='index', columns=['LargoCm', 'AnchoCm', 'AltoCm', 'Prioridad', 'Remontable'])
     not_loaded_best.index.name = 'Partida'
-    not_loaded_best.to_excel('not_loaded.xlsx')
+    if output_dir is None:
+        not_loaded_best.to_excel('not_loaded.xlsx')
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        not_loaded_best.to_excel(os.path.join(output_dir, f'not_loaded_{viaje}.xlsx'))
 
     # If we are uing load_type 2 we save the solution as a json file to use it later
     if load_type == 2:
-        output = {}
-        output['solution'] = all_solutions[x_sorted_keys[0]][0]
-        output['PPs'] = all_solutions[x_sorted_keys[0]][2]
-        with open(f'soluciones/output_{viaje}.json', 'w') as file:
-            json.dump(output, file)
+        best_x = replay(archive.best(2)[0][1])
+        LoadedContainer.from_result(best_x).to_json(state_path(viaje, output_dir))
 
-    return avg_pctg, floor_sorted_keys[0], volume_sorted_keys[0], len(not_loaded_best)
+    return avg_pctg, best_floor[0], best_volume[0], len(not_loaded_best)
 
 #get_volumes('VBCN2403418', load_type=2, file_path='input_RCH/primera_VBCN2403418.xlsx')
 #get_volumes('VBCN2403418', load_type=4, file_path='input_RCH/resto_VBCN2403418.xlsx')   
@@ -0,0 +1,69 @@
+import heapq
+
+from .stopping import objective
+
+def dominates(scores1, scores2):
+    # A solution dominates another one if it is at least as good in volume, floor and x axis and better in one of them
+    return (scores1[0] >= scores2[0] and scores1[1] >= scores2[1] and scores1[2] <= scores2[2]
+            and scores1 != scores2)
+
+class SolutionArchive:
+    """
+    Keep the best restarts as they finish, without storing every restart.
+
+    Parameters:
+        top_k (int): Number of solutions kept for each objective (volume, x axis and floor).
+
+    Each restart is stored as a tuple (scores, seed) where scores is (pctg_volume, pctg_floor, x_axis). A restart only
+    depends on its seed, so the solution of a kept restart is regenerated by running RCH again with its seed. The
+    solutions of the local search are stored the same way with their Candidate instead of the seed.
+    Besides the top_k of each objective we keep the non-dominated front over (volume, floor, x_axis) and the average
+    volume of all the restarts. Restarts with identical scores are all kept, the first one found ranks first.
+    """
+
+    def __init__(self, top_k=5):
+        self.top_k = top_k
+        self.count = 0
+        self.restarts = 0
+        self.mean_volume = 0.0
+
+        # One heap per objective, the worst solution kept is always at the top of the heap
+        self.keys = {load_type: objective(load_type) for load_type in (1, 2, 3)}
+        self.heaps = {load_type: [] for load_type in self.keys}
+        self.front = []
+
+    def add(self, scores, seed, restart=True):
+        # Only the restarts count for the average volume, not the solutions of the local search
+        entry = (scores, seed)
+        self.count += 1
+
+        # Running average of the volume
+        if restart:
+            self.restarts += 1
+            self.mean_volume += (scores[0] - self.mean_volume) / self.restarts
+
+        # Earlier solutions win ties so we use the negative count as the second element of the heap items
+        for load_type, key in self.keys.items():
+            item = (key(scores), -self.count, entry)
+            heap = self.heaps[load_type]
+
+            if len(heap) < self.top_k:
+                heapq.heappush(heap, item)
+            elif item[0:2] > heap[0][0:2]:
+                heapq.heapreplace(heap, item)
+
+        # Update the non-dominated front, a solution only enters if nothing in the front is at least as good
+        if not any(dominates(x[0], scores) or x[0] == scores for x in self.front):
+            self.front = [x for x in self.front if not dominates(scores, x[0])]
+            self.front.append(entry)
+
+    def best(self, load_type):
+        # Kept restarts sorted from best to worst for the objective of the load type
+        if load_type == 4:
+            load_type = 2
+
+        return [x[2] for x in sorted(self.heaps[load_type], key=lambda x: x[0:2], reverse=True)]
+
+    def pareto(self):
+        # Non-dominated restarts (scores, seed), from the one with most volume to the one with least
+        return sorted(self.front, key=lambda x: (-x[0][0], -x[0][1], x[0][2]))
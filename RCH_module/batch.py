@@ -0,0 +1,237 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from .RCH import get_volumes
+from .cache import TripCache
+from .instrumentation import Recorder
+from .ingest import TripStore, fetch_trips, DB_FILTERS, DB_VIEW
+from .stopping import StoppingPolicy
+from .archive import SolutionArchive
+from .local_search import Candidate
+
+# Columns of the consolidated results table, the same names as in carga_simple.ipynb
+RESULT_COLUMNS = ['CodigoViaje', 'AverageVolume', 'BestFloorV', 'BestFloorF', 'BestVolumeV', 'BestVolumeF',
+                  'BestVolumeSeed', 'NotLoaded', 'Restarts', 'Duplicates', 'StopReason', 'Runtime', 'Error', 'Report',
+                  'Pareto']
+
+def select_trips(store, trips=None, tipo_equipo=None, closed_from=None, closed_to=None):
+    """
+    Trips of the store to evaluate.
+
+    Parameters:
+        store (TripStore): Store with the trips.
+        trips (list): Trips to evaluate, None for every trip in the store.
+        tipo_equipo (str): Only the trips with this TipoEquipo, e.g. "MAXI 45'".
+        closed_from (str): Only the trips with FechaCierreViaje after this date.
+        closed_to (str): Only the trips with FechaCierreViaje before this date.
+
+    Returns:
+        list: Trips that pass the filters and have partidas in the store.
+    """
+    viajes = store.viajes()
+    if trips is not None:
+        viajes = viajes[viajes['CodigoViaje'].isin(trips)]
+    if tipo_equipo is not None:
+        viajes = viajes[viajes['TipoEquipo'] == tipo_equipo]
+    if closed_from is not None:
+        viajes = viajes[viajes['FechaCierreViaje'] > closed_from]
+    if closed_to is not None:
+        viajes = viajes[viajes['FechaCierreViaje'] < closed_to]
+
+    return [x for x in viajes['CodigoViaje'] if x in store]
+
+def run_trip(viaje, source, load_type, max_restarts, time_budget, output_dir, cache_dir, instrument=False):
+    # Evaluate one trip in a worker process, the source is a TripStore folder, a folder with test_{viaje}.xlsx files
+    # or a DataFrame with the partidas of the trip
+    start = time.perf_counter()
+    stopping = StoppingPolicy(max_restarts=max_restarts, time_budget=time_budget)
+    cache = TripCache(cache_dir) if cache_dir is not None else None
+    recorder = Recorder() if instrument else None
+    archive = SolutionArchive()
+
+    if isinstance(source, pd.DataFrame):
+        inputs = {'df': source}
+    elif os.path.exists(os.path.join(source, 'index.json')):
+        inputs = {'store': TripStore(source)}
+    else:
+        inputs = {'file_path': os.path.join(source, f'test_{viaje}.xlsx')}
+
+    avg_volume, best_floor, best_volume, not_loaded = get_volumes(viaje, load_type=load_type, stopping=stopping,
+                                                                  archive=archive, cache=cache, output_dir=output_dir,
+                                                                  recorder=recorder, **inputs)
+
+    # A Candidate of the local search is written as its key, replay_solution takes both forms
+    def seed_key(seed):
+        return seed.key if isinstance(seed, Candidate) else seed
+
+    seed = archive.best(1)[0][1]
+
+    return {
+        'CodigoViaje': viaje,
+        'AverageVolume': avg_volume,
+        'BestFloorV': best_floor[0],
+        'BestFloorF': best_floor[1],
+        'BestVolumeV': best_volume[0],
+        'BestVolumeF': best_volume[1],
+        'BestVolumeSeed': seed_key(seed),
+        'NotLoaded': not_loaded,
+        'Restarts': stopping.restarts,
+        'Duplicates': stopping.duplicate_rate,
+        'StopReason': stopping.stop_reason,
+        'Runtime': time.perf_counter() - start,
+        'Error': '',
+        'Report': json.dumps(recorder.report()) if recorder is not None else '',
+        'Pareto': json.dumps([list(scores) + [seed_key(seed)] for scores, seed in archive.pareto()])
+    }
+
+def run_batch(trips, source, output_dir, load_type=1, max_restarts=15000, time_budget=None, n_workers=1, cache_dir=None,
+              instrument=False):
+    """
+    Evaluate several trips, spreading the trips over a pool of worker processes.
+
+    Parameters:
+        trips (list): Trips to evaluate.
+        source (str): TripStore folder, or folder with the test_{viaje}.xlsx files.
+        output_dir (str): Folder for the results, every trip writes its own not_loaded_{viaje}.xlsx file.
+        load_type (int): Load type used for every trip.
+        max_restarts (int): Maximum number of restarts of each trip.
+        time_budget (float): Time budget in seconds of each trip.
+        n_workers (int): Number of trips evaluated at the same time.
+        cache_dir (str): Folder of the TripCache, None to not use the cache.
+        instrument (bool): Add the timers and counters of the Recorder of each trip to the Report column as json.
+
+    Returns:
+        str: Path of results.csv, a row is appended as soon as a trip finishes.
+    """
+    return run_stream(((viaje, source) for viaje in trips), output_dir, load_type, max_restarts, time_budget,
+                      n_workers, cache_dir, instrument)
+
+def run_stream(trips, output_dir, load_type=1, max_restarts=15000, time_budget=None, n_workers=1, cache_dir=None,
+               instrument=False):
+    """
+    Evaluate the trips as they arrive, e.g. from ingest.fetch_trips while the next trips are still being read.
+
+    Parameters:
+        trips (iterable): Pairs (viaje, source), the source is a TripStore folder, a folder with the
+            test_{viaje}.xlsx files or a DataFrame with the partidas of the trip.
+        The rest of parameters are the ones of run_batch.
+
+    Returns:
+        str: Path of results.csv, a row is appended as soon as a trip finishes.
+
+    Only 2 * n_workers trips are waiting or running at once, the next trip is taken from trips when one of them
+    finishes, so the trips that are not evaluated yet are not kept in memory.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, 'results.csv')
+
+    with open(results_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        file.flush()
+
+        # Only this process writes the results table, a trip that fails doesn't stop the rest of the batch
+        def write(viaje, future):
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {'CodigoViaje': viaje, 'Error': repr(e)}
+
+            writer.writerow(row)
+            file.flush()
+            print(f"{row['CodigoViaje']}: {row.get('BestVolumeV', row['Error'])}")
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {}
+            for viaje, source in trips:
+                if len(futures) >= 2 * n_workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(futures.pop(future), future)
+
+                futures[executor.submit(run_trip, viaje, source, load_type, max_restarts, time_budget, output_dir,
+                                        cache_dir, instrument)] = viaje
+
+            for future in as_completed(futures):
+                write(futures[future], future)
+
+    return results_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate the RCH algorithm over several trips')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--store', help='TripStore folder written by RCH_module.ingest')
+    source.add_argument('--input-dir', help='Folder with the test_{viaje}.xlsx files')
+    source.add_argument('--odbc', help='ODBC connection string of the warehouse database (needs pyodbc)')
+    source.add_argument('--sqlite', help='SQLite database with the view of the partidas')
+    parser.add_argument('--view', default=DB_VIEW, help='View of the partidas in the database')
+    parser.add_argument('--trip-column', default='ExpedicionDestino', help='Column of the view that groups the trips')
+    parser.add_argument('--order-column', default='PartidaCodigoPartida',
+                        help='Column of the view that sorts the partidas of a trip')
+    parser.add_argument('--where', nargs='+', metavar='COLUMN=VALUE',
+                        help='Filters of the database query, by default the ones of fetch_input.ipynb')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched at once from the database')
+    parser.add_argument('--output', default='resultados', help='Folder for results.csv and the files of each trip')
+    parser.add_argument('--trips', nargs='+', help='Trips to evaluate, by default every trip of the source')
+    parser.add_argument('--tipo-equipo', help="Only trips with this TipoEquipo, e.g. \"MAXI 45'\" (needs --store)")
+    parser.add_argument('--closed-from', help='Only trips with FechaCierreViaje after this date (needs --store)')
+    parser.add_argument('--closed-to', help='Only trips with FechaCierreViaje before this date (needs --store)')
+    parser.add_argument('--load-type', type=int, default=1, choices=[1, 2, 3])
+    parser.add_argument('--restarts', type=int, default=15000, help='Maximum number of restarts of each trip')
+    parser.add_argument('--time-budget', type=float, help='Time budget in seconds of each trip')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of trips evaluated at the same time')
+    parser.add_argument('--cache', help='Folder of the cache of preprocessed trips')
+    parser.add_argument('--instrument', action='store_true', help='Save the timers and counters of each trip')
+    args = parser.parse_args(argv)
+
+    if args.odbc is not None or args.sqlite is not None:
+        if args.tipo_equipo or args.closed_from or args.closed_to:
+            parser.error('the trip filters need --store')
+
+        filters = dict(DB_FILTERS) if args.where is None else {}
+        for condition in args.where or []:
+            column, _, value = condition.partition('=')
+            filters.setdefault(column, []).append(value)
+        if args.trips is not None:
+            filters[args.trip_column] = args.trips
+
+        if args.odbc is not None:
+            import pyodbc
+            connection = pyodbc.connect(args.odbc)
+        else:
+            connection = sqlite3.connect(args.sqlite)
+
+        # The trips are evaluated while the next ones are still being fetched
+        with closing(connection):
+            trips = fetch_trips(connection, filters, args.trip_column, args.view, order_column=args.order_column,
+                                chunk_size=args.chunk_size)
+            results_path = run_stream(trips, args.output, args.load_type, args.restarts, args.time_budget,
+                                      args.workers, args.cache, args.instrument)
+        print(f'Results in {results_path}')
+        return
+
+    if args.store is not None:
+        trips = select_trips(TripStore(args.store), args.trips, args.tipo_equipo, args.closed_from, args.closed_to)
+    else:
+        if args.tipo_equipo or args.closed_from or args.closed_to:
+            parser.error('the trip filters need --store')
+        files = sorted(glob.glob(os.path.join(args.input_dir, 'test_*.xlsx')))
+        trips = [os.path.basename(x)[len('test_'):-len('.xlsx')] for x in files]
+        if args.trips is not None:
+            trips = [x for x in trips if x in args.trips]
+
+    results_path = run_batch(trips, args.store or args.input_dir, args.output, args.load_type, args.restarts,
+                             args.time_budget, args.workers, args.cache, args.instrument)
+    print(f'{len(trips)} trips, results in {results_path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import RCH as rch
+from .preprocessing import join_box, compile_boxes
+from .archive import SolutionArchive
+from .instrumentation import Recorder
+from .container import MAXI_45
+from .stopping import StoppingPolicy
+
+# Quality metrics of every restart, name and position in the result of RCH
+METRICS = {'volume': 0, 'floor': 1, 'x_axis': 2}
+
+# Default tolerances of the comparison against a baseline
+#   volume, floor: percentage points the mean can drop
+#   x_axis: cm the mean can grow
+#   not_loaded: boxes the mean can grow
+#   speed: fraction of restarts per second that can be lost
+TOLERANCES = {'volume': 0.5, 'floor': 0.5, 'x_axis': 10, 'not_loaded': 0.5, 'speed': 0.2}
+
+def _distribution(values):
+    values = np.asarray(values, dtype=float)
+    return {
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'p50': float(np.percentile(values, 50)),
+        'max': float(values.max())
+    }
+
+# Restart loops that can be measured
+#   search: the one of get_volumes, rch.search with its RestartMemo and PrefixCache
+#   rch: every restart runs RCH from scratch, without the memo and the prefix cache
+PATHS = ('search', 'rch')
+
+def _restarts(container_dimensions, table, hmap, load_type, viaje, seeds, recorder=None, path='search'):
+    # Scores and boxes not loaded of every restart, the archive is included so its memory is measured as well
+    archive = SolutionArchive()
+    results = []
+    if path == 'search':
+        stopping = StoppingPolicy(max_restarts=len(seeds))
+        rch.search(container_dimensions, table, hmap, load_type, viaje, seeds=seeds, stopping=stopping,
+                   archive=archive, recorder=recorder, results=results)
+        return results
+
+    for seed in seeds:
+        result = rch.RCH(container_dimensions, table, hmap, load_type, viaje, recorder is not None, seed)
+        pctg_volume, pctg_floor, x_axis, solution, not_loaded, PPs = result[0:6]
+        archive.add((pctg_volume, pctg_floor, x_axis), seed)
+        results.append((pctg_volume, pctg_floor, x_axis, len(not_loaded)))
+
+        if recorder is not None:
+            recorder.merge(result[6])
+
+    return results
+
+def benchmark_trip(file_path, viaje, seeds, load_type=1, memory=True, container_dimensions=MAXI_45, path='search'):
+    """
+    Run the restarts of a trip with fixed seeds and measure speed, memory and quality.
+
+    Parameters:
+        file_path (str): Input excel of the trip.
+        viaje (str): Trip code.
+        seeds (list): Seeds of the restarts, the same seeds always give the same solutions.
+        load_type (int): Load type of the restarts.
+        memory (bool): Measure the peak memory with tracemalloc in another run of the same restarts.
+        container_dimensions (ContainerSpec): Container of the trip.
+        path (str): Restart loop measured, one of PATHS.
+
+    Returns:
+        dict: Restarts per second, seconds spent in each phase, the counters of the Recorder, peak memory in MB
+        and the distribution of every quality metric over the restarts.
+    """
+    phases = {}
+
+    start = time.perf_counter()
+    df = pd.read_excel(file_path)
+    phases['read_excel'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df, hmap = join_box(df, container_dimensions)
+    phases['join_box'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = compile_boxes(df, container_dimensions)
+    phases['compile_boxes'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = _restarts(container_dimensions, table, hmap, load_type, viaje, seeds, path=path)
+    elapsed = time.perf_counter() - start
+
+    # The phases and counters come from a second run with a Recorder so they don't slow down the first one
+    recorder = Recorder()
+    _restarts(container_dimensions, table, hmap, load_type, viaje, seeds, recorder, path)
+    phases.update(recorder.timers)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            _restarts(container_dimensions, table, hmap, load_type, viaje, seeds, path=path)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024**2
+        finally:
+            tracemalloc.stop()
+
+    quality = {name: _distribution([x[i] for x in results]) for name, i in METRICS.items()}
+    quality['not_loaded'] = _distribution([x[3] for x in results])
+
+    return {
+        'boxes': len(table),
+        'restarts': len(seeds),
+        'restarts_per_s': len(seeds) / elapsed,
+        'phases': phases,
+        'counters': recorder.counters,
+        'peak_mb': peak_mb,
+        'quality': quality,
+        'best_volume': max(x[0] for x in results)
+    }
+
+def run_benchmark(files, restarts=100, first_seed=0, load_type=1, memory=True, path='search'):
+    # Benchmark every trip with the same seeds, files is a dict {viaje: input excel}
+    seeds = list(range(first_seed, first_seed + restarts))
+    trips = {}
+    for viaje, file_path in files.items():
+        trips[viaje] = benchmark_trip(file_path, viaje, seeds, load_type, memory, path=path)
+        print(f"{viaje}: {trips[viaje]['restarts_per_s']:.1f} restarts/s, "
+              f"volume {trips[viaje]['quality']['volume']['mean']:.2f}", file=sys.stderr)
+
+    summary = {
+        'restarts_per_s': float(np.mean([x['restarts_per_s'] for x in trips.values()])),
+        'volume': float(np.mean([x['quality']['volume']['mean'] for x in trips.values()])),
+        'floor': float(np.mean([x['quality']['floor']['mean'] for x in trips.values()])),
+        'x_axis': float(np.mean([x['quality']['x_axis']['mean'] for x in trips.values()])),
+        'not_loaded': float(np.mean([x['quality']['not_loaded']['mean'] for x in trips.values()])),
+        'phases': {}
+    }
+    for trip in trips.values():
+        for name, value in trip['phases'].items():
+            summary['phases'][name] = summary['phases'].get(name, 0.0) + value
+    peaks = [x['peak_mb'] for x in trips.values() if x['peak_mb'] is not None]
+    summary['peak_mb'] = max(peaks) if peaks else None
+
+    return {
+        'settings': {'restarts': restarts, 'first_seed': first_seed, 'load_type': load_type, 'path': path},
+        'trips': trips,
+        'summary': summary
+    }
+
+def compare(results, baseline, tolerances=TOLERANCES):
+    """
+    Compare a benchmark against a baseline of the same trips and seeds.
+
+    Returns:
+        list: One message for each metric of a trip that is worse than the baseline by more than its tolerance.
+    """
+    if results['settings'] != baseline['settings']:
+        raise ValueError(f"The baseline was run with {baseline['settings']}, not {results['settings']}")
+
+    regressions = []
+    for viaje, trip in results['trips'].items():
+        if viaje not in baseline['trips']:
+            continue
+        base = baseline['trips'][viaje]
+
+        # Volume and floor have to be maximized, x axis and boxes not loaded minimized
+        for name, sign in (('volume', 1), ('floor', 1), ('x_axis', -1), ('not_loaded', -1)):
+            change = sign * (trip['quality'][name]['mean'] - base['quality'][name]['mean'])
+            if change < -tolerances[name]:
+                regressions.append(f"{viaje} {name}: {base['quality'][name]['mean']:.2f} -> {trip['quality'][name]['mean']:.2f}")
+
+        if trip['restarts_per_s'] < base['restarts_per_s'] * (1 - tolerances['speed']):
+            regressions.append(f"{viaje} speed: {base['restarts_per_s']:.1f} -> {trip['restarts_per_s']:.1f} restarts/s")
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark speed and quality of the RCH algorithm with fixed seeds')
+    parser.add_argument('--input-dir', default='viajes_prueba', help='Folder with the test_{viaje}.xlsx files')
+    parser.add_argument('--trips', nargs='+', help='Trips to run, by default every trip of the folder')
+    parser.add_argument('--every', type=int, default=1, help='Only run one of every n trips of the folder')
+    parser.add_argument('--restarts', type=int, default=100, help='Restarts of each trip')
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--load-type', type=int, default=1, choices=[1, 2, 3])
+    parser.add_argument('--path', default='search', choices=PATHS,
+                        help='Restart loop measured, search is the one of get_volumes (memo and prefix cache)')
+    parser.add_argument('--no-memory', action='store_true', help="Don't measure the peak memory")
+    parser.add_argument('--save', help='Save the results as json, e.g. to use them as the baseline later')
+    parser.add_argument('--baseline', help='Baseline json to compare with, the exit code is 1 if there are regressions')
+    for name, value in TOLERANCES.items():
+        parser.add_argument(f'--tol-{name.replace("_", "-")}', type=float, default=value)
+    args = parser.parse_args(argv)
+
+    files = sorted(glob.glob(os.path.join(args.input_dir, 'test_*.xlsx')))
+    files = {os.path.basename(x)[len('test_'):-len('.xlsx')]: x for x in files}
+    if args.trips is not None:
+        files = {viaje: x for viaje, x in files.items() if viaje in args.trips}
+    files = dict(list(files.items())[::args.every])
+
+    results = run_benchmark(files, args.restarts, args.first_seed, args.load_type, not args.no_memory, args.path)
+    print(json.dumps(results['summary'], indent=2))
+
+    if args.save is not None:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        tolerances = {name: getattr(args, f'tol_{name}') for name in TOLERANCES}
+        regressions = compare(results, baseline, tolerances)
+        for message in regressions:
+            print('REGRESSION', message)
+        print(f'{len(regressions)} regressions against {args.baseline}')
+
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from .preprocessing import LENGTH_TOLERANCE, HEIGHT_TOLERANCE, VOLUMETRIC_TOLERANCE
+
+# Bump it when join_box or the BoxTable change so the old entries are not used anymore
+CACHE_VERSION = 1
+
+class TripCache:
+    """
+    On-disk cache of the preprocessed trips (combined DataFrame, hmap and BoxTable).
+
+    Parameters:
+        directory (str): Folder where the entries are stored, it is created if it doesn't exist.
+        max_bytes (int): Maximum size of the cache, the least recently used entries are removed above it.
+
+    The key is a hash of the input rows (the bytes of the Excel file or the rows of a DataFrame), the container
+    dimensions, the preprocessing tolerances and CACHE_VERSION, so changing any of them gives a new entry.
+    """
+
+    def __init__(self, directory='.rch_cache', max_bytes=512 * 1024**2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, container_dimensions, width_combinations=True):
+        # The source is either the path of the input file or the input DataFrame
+        digest = hashlib.sha256()
+        if isinstance(source, pd.DataFrame):
+            digest.update(','.join(map(str, source.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(source, index=False).values.tobytes())
+        else:
+            with open(source, 'rb') as file:
+                for block in iter(lambda: file.read(1024**2), b''):
+                    digest.update(block)
+
+        settings = (CACHE_VERSION, tuple(container_dimensions), LENGTH_TOLERANCE, HEIGHT_TOLERANCE,
+                    VOLUMETRIC_TOLERANCE, width_combinations)
+        digest.update(repr(settings).encode())
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        # Returns (df, hmap, table) or None if the trip is not in the cache
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # We update the modification time so the eviction removes the least recently used entries first
+        os.utime(path)
+        self.hits += 1
+        return entry
+
+    def put(self, key, df, hmap, table):
+        # We write to a temporary file first so another process never reads half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((df, hmap, table), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(x[1] for x in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.pkl', '.tmp')):
+                os.remove(entry.path)
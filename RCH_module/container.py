@@ -0,0 +1,72 @@
+import math
+
+class ContainerSpec(tuple):
+    """
+    Dimensions of a type of container, it can be used anywhere a list [length, width, height] is expected.
+
+    Parameters:
+        length, width, height (int): Inner dimensions in cm used to pack the boxes.
+        nominal_width (int): Width of the equipment in the catalogue, the PPs next to the side walls and the corner
+            PPs are measured from it. By default the same as width.
+        name (str): TipoEquipo of the container.
+    """
+
+    def __new__(cls, length, width, height, nominal_width=None, name=None):
+        spec = super().__new__(cls, (length, width, height))
+        spec.nominal_width = width if nominal_width is None else nominal_width
+        spec.name = name
+        return spec
+
+    def __getnewargs__(self):
+        return (*self, self.nominal_width, self.name)
+
+    def __repr__(self):
+        return f'ContainerSpec({self.name!r}, {self[0]}x{self[1]}x{self[2]}, nominal width {self.nominal_width})'
+
+    @property
+    def length(self):
+        return self[0]
+
+    @property
+    def width(self):
+        return self[1]
+
+    @property
+    def height(self):
+        return self[2]
+
+    @property
+    def volume(self):
+        return self[0] * self[1] * self[2]
+
+    @classmethod
+    def of(cls, container_dimensions):
+        # Spec of the given dimensions. A plain [length, width, height] of a known equipment type gets its spec, so
+        # [1350, 246, 259] keeps the 244 cm nominal width of MAXI_45 the PPs were always measured from. Any other
+        # list has its width as the nominal width
+        if isinstance(container_dimensions, ContainerSpec):
+            return container_dimensions
+
+        for spec in EQUIPMENT.values():
+            if tuple(container_dimensions) == tuple(spec):
+                return spec
+
+        return cls(*container_dimensions)
+
+    @classmethod
+    def from_viaje(cls, viaje):
+        # Spec of a row of the Viajes table, the known equipment types use their measured spec
+        if viaje['TipoEquipo'] in EQUIPMENT:
+            return EQUIPMENT[viaje['TipoEquipo']]
+
+        if any(isinstance(viaje[x], float) and math.isnan(viaje[x]) for x in ('LargoCm', 'AnchoCm', 'AltoCm')):
+            raise ValueError(f"The dimensions of {viaje['TipoEquipo']} are not known")
+
+        return cls(int(viaje['LargoCm']), int(viaje['AnchoCm']), int(viaje['AltoCm']), name=viaje['TipoEquipo'])
+
+# The MAXI 45' is 244 cm wide in the catalogue, the boxes are packed in 246 cm to allow for the tolerance of the
+# measures of the partidas
+MAXI_45 = ContainerSpec(1350, 246, 259, nominal_width=244, name="MAXI 45'")
+
+# Equipment types with a measured spec, the rest of types take their dimensions from the Viajes table
+EQUIPMENT = {MAXI_45.name: MAXI_45}
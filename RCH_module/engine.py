@@ -0,0 +1,56 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Arguments shared by every restart in a worker process, set once by the pool initializer
+_worker = {}
+
+def _init_worker(restart, args):
+    # Each worker receives the restart function and the preprocessed trip only once
+    _worker['restart'] = restart
+    _worker['args'] = args
+
+def _run_chunk(seeds):
+    # Every restart gets its own seed so the result only depends on the seed and not on the worker that runs it
+    return [(seed, _worker['restart'](*_worker['args'], seed=seed)) for seed in seeds]
+
+def run_restarts(restart, args, seeds, n_workers=1, chunksize=32):
+    """
+    Run one restart per seed, spreading the restarts over a pool of worker processes.
+
+    Parameters:
+        restart (callable): Module level function that generates one solution from a seed keyword argument, e.g. RCH.
+        args (tuple): Arguments passed to every call of restart (container dimensions, df, hmap...).
+        seeds (iterable): One seed per restart, it can be unbounded if the caller stops iterating.
+        n_workers (int): Number of worker processes, with 1 the restarts are run in the current process.
+        chunksize (int): Number of restarts sent to a worker at once.
+
+    Returns:
+        generator: Tuples (seed, result) in the same order as the seeds, whatever the number of workers.
+        Closing the generator cancels the restarts that have not started yet.
+    """
+    if n_workers <= 1:
+        for seed in seeds:
+            yield seed, restart(*args, seed=seed)
+        return
+
+    seeds = iter(seeds)
+    executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(restart, args))
+    try:
+        # We only keep a few chunks per worker in flight so stopping early doesn't have to wait for every seed
+        in_flight = deque()
+        for _ in range(2 * n_workers):
+            chunk = list(islice(seeds, chunksize))
+            if chunk:
+                in_flight.append(executor.submit(_run_chunk, chunk))
+
+        while in_flight:
+            results = in_flight.popleft().result()
+
+            chunk = list(islice(seeds, chunksize))
+            if chunk:
+                in_flight.append(executor.submit(_run_chunk, chunk))
+
+            yield from results
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
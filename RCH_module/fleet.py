@@ -0,0 +1,183 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .RCH import preprocess_trip, search, regenerate
+from .archive import SolutionArchive
+from .stopping import StoppingPolicy
+
+def pack_container(spec, df, load_type=1, viaje=None, max_restarts=1000, time_budget=None):
+    """
+    Sub-problem of a fleet, load as many partidas as possible in one container.
+
+    Parameters:
+        spec (ContainerSpec): Container.
+        df (pd.DataFrame): Partidas that are still not loaded.
+        load_type (int): Load type of the restarts.
+        viaje (str): Code used for the container.
+        max_restarts (int), time_budget (float): Stopping policy of the restarts.
+
+    Returns:
+        dict: spec, scores and seed of the best restart, its solution, the ids of the partidas loaded and the number
+        of restarts.
+    """
+    df, hmap, table = preprocess_trip(df, spec)
+    stopping = StoppingPolicy(max_restarts=max_restarts, time_budget=time_budget)
+    archive = search(spec, table, hmap, load_type, viaje, stopping=stopping, archive=SolutionArchive())
+
+    scores, seed = archive.best(load_type)[0]
+    solution = regenerate(spec, table, hmap, load_type, viaje, seed)[3]
+
+    # The solution only has single boxes, the combined boxes are already separated
+    return {'spec': spec, 'scores': scores, 'seed': seed, 'solution': solution,
+            'loaded': {id for id, box in solution}, 'restarts': stopping.restarts}
+
+def _volume(df):
+    return df['LargoCm'] * df['AnchoCm'] * df['AltoCm']
+
+def _remaining(df, loaded):
+    # Partidas of df that are not in any of the loaded sets of ids
+    ids = pd.Series(list(zip(df['Partida'], df['Expedicion'])), index=df.index)
+    return df[~ids.isin(set().union(*loaded))]
+
+def _split(df, k):
+    # Longest processing time rule on the volume, each partida goes to the group with less volume so far
+    groups = [[] for _ in range(k)]
+    volumes = [0.0] * k
+    for row, volume in _volume(df).sort_values(ascending=False, kind='stable').items():
+        i = int(np.argmin(volumes))
+        groups[i].append(row)
+        volumes[i] += volume
+
+    # Each group keeps the order of the partidas of the trip
+    return [df.loc[sorted(rows)] for rows in groups if rows]
+
+class FleetPlan:
+    """
+    Containers used to load the partidas of a trip or a day, each one with its solution.
+
+    Attributes:
+        containers (list): Results of pack_container, in the order the containers are loaded.
+        not_loaded (pd.DataFrame): Partidas that don't fit in any container of the fleet.
+        strategy (str): How the plan was found, 'turn' or 'parallel' with the type of the containers.
+    """
+
+    def __init__(self, containers, not_loaded, strategy):
+        self.containers = containers
+        self.not_loaded = not_loaded
+        self.strategy = strategy
+
+    def __len__(self):
+        return len(self.containers)
+
+    @property
+    def capacity(self):
+        return sum(x['spec'].volume for x in self.containers)
+
+    def key(self):
+        # Smaller is better: fewest partidas left, then fewest containers, then least capacity
+        return (len(self.not_loaded), len(self), self.capacity)
+
+    def summary(self):
+        # One row per container with its type and scores
+        return pd.DataFrame([{'Container': i, 'TipoEquipo': x['spec'].name, 'Partidas': len(x['loaded']),
+                              'Volume%': x['scores'][0], 'Floor%': x['scores'][1], 'XAxis': x['scores'][2],
+                              'Seed': x['seed']} for i, x in enumerate(self.containers)])
+
+class FleetPlanner:
+    """
+    Assign the partidas of a trip (or of a whole day) to several containers of the available equipment types.
+
+    Parameters:
+        fleet (list): ContainerSpec of each equipment type that can be used, there is no limit of containers per type.
+        load_type (int): Load type of each container.
+        max_restarts (int), time_budget (float): Stopping policy of each container.
+        n_workers (int): Number of containers evaluated at the same time, each one in its own process.
+        max_containers (int): Maximum number of containers of a plan.
+
+    Two strategies are tried and the plan with fewest containers is kept:
+        turn: the containers are loaded one after another, the partidas that don't fit go to the next one. For each
+            container every type of the fleet is evaluated at the same time and we keep the one that loads every
+            partida left with the smallest container, or else the one that loads the most volume.
+        parallel: for each type we estimate how many containers the volume needs, split the partidas between them
+            and load all of them at the same time. The partidas that don't fit are loaded with the turn strategy.
+    """
+
+    def __init__(self, fleet, load_type=1, max_restarts=1000, time_budget=None, n_workers=1, max_containers=10):
+        if not fleet:
+            raise ValueError('The fleet needs at least one type of container')
+
+        self.fleet = list(fleet)
+        self.load_type = load_type
+        self.max_restarts = max_restarts
+        self.time_budget = time_budget
+        self.n_workers = n_workers
+        self.max_containers = max_containers
+
+    def _pack(self, executor, problems):
+        # Evaluate the sub-problems (spec, partidas, name) at the same time if there is a pool of workers
+        args = [(spec, df, self.load_type, name, self.max_restarts, self.time_budget) for spec, df, name in problems]
+        if executor is None:
+            return [pack_container(*x) for x in args]
+
+        return [future.result() for future in [executor.submit(pack_container, *x) for x in args]]
+
+    def _turn(self, executor, df, containers, viaje):
+        containers = list(containers)
+        remaining = df
+        while len(remaining) and len(containers) < self.max_containers:
+            name = f'{viaje}_{len(containers)}'
+            candidates = self._pack(executor, [(spec, remaining, name) for spec in self.fleet])
+
+            # A container that loads everything left ends the plan, the smallest one is the best
+            complete = [x for x in candidates if len(x['loaded']) == len(remaining)]
+            if complete:
+                best = min(complete, key=lambda x: x['spec'].volume)
+            else:
+                best = max(candidates, key=lambda x: x['scores'][0] * x['spec'].volume)
+
+            if not best['loaded']:
+                break
+
+            containers.append(best)
+            remaining = _remaining(remaining, [best['loaded']])
+
+        return containers, remaining
+
+    def _parallel(self, executor, df, spec, viaje):
+        # The volume of the partidas gives a lower bound of the number of containers
+        k = max(1, math.ceil(_volume(df).sum() / spec.volume))
+        k = min(k, self.max_containers)
+        groups = _split(df, k)
+        containers = self._pack(executor, [(spec, group, f'{viaje}_{i}') for i, group in enumerate(groups)])
+        containers = [x for x in containers if x['loaded']]
+
+        return self._turn(executor, _remaining(df, [x['loaded'] for x in containers]), containers, viaje)
+
+    def plan(self, df, viaje='fleet', strategies=('turn', 'parallel')):
+        """
+        Find the plan with fewest containers for the partidas of df.
+
+        Parameters:
+            df (pd.DataFrame): Partidas to load, with the same columns as the test_{viaje}.xlsx files.
+            viaje (str): Name of the plan, the containers are named {viaje}_{i}.
+            strategies (tuple): Strategies tried, 'turn' and/or 'parallel'.
+
+        Returns:
+            FleetPlan: Best plan, the one with fewest partidas left and then fewest containers.
+        """
+        executor = ProcessPoolExecutor(max_workers=self.n_workers) if self.n_workers > 1 else None
+        try:
+            plans = []
+            if 'turn' in strategies:
+                plans.append(FleetPlan(*self._turn(executor, df, [], viaje), 'turn'))
+            if 'parallel' in strategies:
+                for spec in self.fleet:
+                    plans.append(FleetPlan(*self._parallel(executor, df, spec, viaje), f'parallel {spec.name}'))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return min(plans, key=FleetPlan.key)
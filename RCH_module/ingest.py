@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .container import MAXI_45
+
+STORE_VERSION = 1
+
+def read_workbook(path):
+    """
+    Parse the Viajes and Partidas sheets of the multi-trip workbook and normalize them.
+
+    Parameters:
+        path (str): Path of the workbook with the Viajes and Partidas sheets.
+
+    Returns:
+        tuple: (viajes, partidas) DataFrames. Remontable is 0/1, the trips have the container dimensions in cm (the
+        catalogue ones in metres, or the nominal ones of MAXI 45') and every partida has its Volumen. The trips also
+        get VolumenCargado, VolumenMax and Volumen%.
+    """
+    xls = pd.ExcelFile(path)
+    viajes = pd.read_excel(xls, 'Viajes')
+    partidas = pd.read_excel(xls, 'Partidas')
+
+    # Remontable comes as SI/NO in the workbook, the rest of the code expects 1/0
+    if partidas['Remontable'].dtype.kind not in 'iuf':
+        partidas['Remontable'] = partidas['Remontable'].map({'NO': 0, 'SI': 1})
+
+    # Every equipment type gets the dimensions of the catalogue, so the other types can be used as a ContainerSpec
+    for column, metres in (('LargoCm', 'TipoEquipoLongitudMetros'), ('AnchoCm', 'TipoEquipoAnchoMetros'),
+                           ('AltoCm', 'TipoEquipoAltoMetros')):
+        if metres in viajes.columns:
+            viajes[column] = (viajes[metres] * 100).round()
+
+    maxi = viajes['TipoEquipo'] == MAXI_45.name
+    viajes.loc[maxi, 'LargoCm'] = MAXI_45.length
+    viajes.loc[maxi, 'AnchoCm'] = MAXI_45.nominal_width
+    viajes.loc[maxi, 'AltoCm'] = MAXI_45.height
+    viajes = viajes.drop(['TipoEquipoAltoMetros', 'TipoEquipoAnchoMetros', 'TipoEquipoLongitudMetros'], axis=1, errors='ignore')
+
+    partidas['Volumen'] = partidas['AltoCm']*partidas['AnchoCm']*partidas['LargoCm']
+
+    volumen_total_por_viaje = partidas.groupby(by=['CodigoViaje'], as_index=False)['Volumen'].agg('sum')
+    volumen_total_por_viaje.rename(columns={'Volumen': 'VolumenCargado'}, inplace=True)
+    viajes = viajes.merge(volumen_total_por_viaje, how='left', on='CodigoViaje')
+
+    viajes['VolumenMax'] = viajes['AltoCm']*viajes['AnchoCm']*viajes['LargoCm']
+    viajes['Volumen%'] = viajes['VolumenCargado']/viajes['VolumenMax'] * 100
+
+    return viajes, partidas
+
+def _write_columns(df, directory):
+    # One .npy file per column so the store can be memory mapped, text is stored as fixed width unicode
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for n, column in enumerate(df.columns):
+        values = df[column]
+        nulls = bool(values.isna().any())
+
+        if values.dtype.kind in 'iufbM':
+            array = values.to_numpy()
+        else:
+            array = values.fillna('').astype(str).to_numpy().astype(str)
+
+        file = f'{n}.npy'
+        np.save(os.path.join(directory, file), array, allow_pickle=False)
+        columns.append({'name': column, 'file': file, 'nulls': nulls})
+
+    return columns
+
+def write_store(viajes, partidas, directory):
+    """
+    Write the trips and their partidas as a columnar store.
+
+    The partidas are sorted by CodigoViaje (keeping the order of the workbook inside each trip) so the partidas of a
+    trip are a contiguous slice, the offsets of each slice are saved in index.json.
+    """
+    partidas = partidas.sort_values('CodigoViaje', kind='stable').reset_index(drop=True)
+    codes = partidas['CodigoViaje'].to_numpy().astype(str)
+    trips, starts = np.unique(codes, return_index=True)
+    stops = np.append(starts[1:], len(codes))
+
+    index = {
+        'version': STORE_VERSION,
+        'viajes': _write_columns(viajes, os.path.join(directory, 'viajes')),
+        'partidas': _write_columns(partidas, os.path.join(directory, 'partidas')),
+        'trips': {trip: [int(start), int(stop)] for trip, start, stop in zip(trips, starts, stops)}
+    }
+    with open(os.path.join(directory, 'index.json'), 'w') as file:
+        json.dump(index, file)
+
+def ingest_workbook(path, directory):
+    # Parse the workbook once and write the store, it returns the store already opened
+    viajes, partidas = read_workbook(path)
+    write_store(viajes, partidas, directory)
+
+    return TripStore(directory)
+
+class TripStore:
+    """
+    Read access to a store written by ingest_workbook.
+
+    Parameters:
+        directory (str): Folder of the store.
+
+    The columns are memory mapped, reading a trip only touches the rows of that trip.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'index.json')) as file:
+            index = json.load(file)
+
+        if index['version'] != STORE_VERSION:
+            raise ValueError(f'Store version {index["version"]} is not supported, ingest the workbook again')
+
+        self.directory = directory
+        self.index = {trip: tuple(offsets) for trip, offsets in index['trips'].items()}
+        self.columns = index['partidas']
+        self.arrays = [np.load(os.path.join(directory, 'partidas', x['file']), mmap_mode='r') for x in self.columns]
+        self.viajes_columns = index['viajes']
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, viaje):
+        return viaje in self.index
+
+    def trips(self):
+        return list(self.index)
+
+    def _frame(self, columns, arrays):
+        data = {}
+        for column, array in zip(columns, arrays):
+            values = np.array(array)
+            if column['nulls'] and values.dtype.kind == 'U':
+                values = np.where(values == '', None, values.astype(object))
+            data[column['name']] = values
+
+        return pd.DataFrame(data)
+
+    def trip(self, viaje):
+        # Partidas of a trip with the same columns as the test_{viaje}.xlsx files
+        try:
+            start, stop = self.index[viaje]
+        except KeyError:
+            raise KeyError(f'Trip {viaje} is not in the store') from None
+
+        return self._frame(self.columns, [x[start:stop] for x in self.arrays])
+
+    def viajes(self):
+        arrays = [np.load(os.path.join(self.directory, 'viajes', x['file'])) for x in self.viajes_columns]
+        return self._frame(self.viajes_columns, arrays)
+
+# View of the warehouse database with the partidas in the warehouse, the one read by fetch_input.ipynb
+DB_VIEW = 'sic_grp.dbo.TXALPartidaEstanciaOptEstibaV'
+
+# Columns of the view with their names in the test_{viaje}.xlsx files
+DB_COLUMNS = {'ExpedicionCodigo': 'Expedicion', 'PartidaKg': 'PesoKg', 'PartidaLargo': 'LargoCm',
+              'PartidaAncho': 'AnchoCm', 'PartidaAlto': 'AltoCm', 'PartidaCodigoPartida': 'Partida',
+              'PartidaFechaEntrada': 'FechaEntradaAlmacen', 'PartidaTipo': 'TipoPartida'}
+
+# Filters of fetch_input.ipynb: pallets of the Barcelona warehouse that went through the volumetric scanner
+DB_FILTERS = {'almacenalias': 'bcn', 'PasadaPorVolumetrica': 1, 'PartidaTipo': 'Palet'}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+
+def _identifier(name):
+    # Names of columns and views go in the query text, only plain identifiers are accepted
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f'{name!r} is not a valid column or view name')
+
+    return name
+
+def partidas_query(filters=None, trip_column='ExpedicionDestino', view=DB_VIEW, columns=None,
+                   order_column='PartidaCodigoPartida'):
+    """
+    Query of the partidas of the warehouse database, with the filters done by the database.
+
+    Parameters:
+        filters (dict): Value of each column of the view, a list for several values and None for NULL.
+        trip_column (str): Column of the view that groups the partidas in trips.
+        view (str): View or table of the partidas.
+        columns (list): Columns to read, every column of the view by default.
+        order_column (str): Column that sorts the partidas inside each trip.
+
+    Returns:
+        tuple: (query, parameters) with qmark placeholders, the ones of pyodbc and sqlite3. The partidas of a trip
+        come together and always in the same order, so the same seeds give the same solutions.
+    """
+    conditions, parameters = [], []
+    for column, value in (filters or {}).items():
+        if value is None:
+            conditions.append(f'{_identifier(column)} IS NULL')
+        elif isinstance(value, (list, tuple, set)):
+            conditions.append(f'{_identifier(column)} IN ({", ".join("?" * len(value))})')
+            parameters.extend(value)
+        else:
+            conditions.append(f'{_identifier(column)} = ?')
+            parameters.append(value)
+
+    select = ', '.join(_identifier(x) for x in columns) if columns else '*'
+    query = f'SELECT {select} FROM {_identifier(view)}'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {_identifier(trip_column)}, {_identifier(order_column)}'
+
+    return query, parameters
+
+def normalize_partidas(df, trip_column='ExpedicionDestino'):
+    # Rows of the view with the same columns and values as the test_{viaje}.xlsx files
+    trips = df[trip_column].astype(str)
+    df = df.rename(columns=DB_COLUMNS)
+    df['CodigoViaje'] = trips
+    if 'NoRemontable' in df.columns:
+        df['Remontable'] = df['NoRemontable'].map({0: 1, 1: 0})
+    if 'FechaCargaContenedor' not in df.columns:
+        df['FechaCargaContenedor'] = 0
+    df['Volumen'] = df['LargoCm']*df['AnchoCm']*df['AltoCm']
+
+    return df
+
+def fetch_trips(connection, filters=DB_FILTERS, trip_column='ExpedicionDestino', view=DB_VIEW, columns=None,
+                order_column='PartidaCodigoPartida', chunk_size=5000):
+    """
+    Read the partidas of the warehouse database trip by trip.
+
+    Parameters:
+        connection: DB-API connection, e.g. pyodbc.connect(...) or sqlite3.connect(...).
+        filters, trip_column, view, columns, order_column: See partidas_query.
+        chunk_size (int): Number of rows fetched at once.
+
+    Yields:
+        tuple: (trip, DataFrame) with the partidas of each trip, with the same columns as the test_{viaje}.xlsx files.
+
+    The rows are fetched in chunks and only the chunks of the trip being read are kept, so the memory doesn't grow
+    with the size of the warehouse. Each chunk goes from rows to column arrays and is normalized on its own, and a
+    trip is given as soon as the first row of the next trip arrives.
+    """
+    query, parameters = partidas_query(filters, trip_column, view, columns, order_column)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, parameters)
+        names = [x[0].strip() for x in cursor.description]
+
+        trip, parts = None, []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            chunk = normalize_partidas(pd.DataFrame(dict(zip(names, zip(*rows)))), trip_column)
+
+            # The rows are sorted by trip, a chunk is split where the trip changes
+            keys = chunk['CodigoViaje'].to_numpy()
+            bounds = [0, *(np.flatnonzero(keys[1:] != keys[:-1]) + 1), len(keys)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                if parts and keys[start] != trip:
+                    yield trip, pd.concat(parts, ignore_index=True)
+                    parts = []
+
+                trip = keys[start]
+                parts.append(chunk.iloc[start:stop])
+
+        if parts:
+            yield trip, pd.concat(parts, ignore_index=True)
+    finally:
+        cursor.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parse the Viajes/Partidas workbook into a columnar store')
+    parser.add_argument('workbook')
+    parser.add_argument('directory')
+    args = parser.parse_args()
+
+    store = ingest_workbook(args.workbook, args.directory)
+    print(f'{len(store)} trips written to {args.directory}')
@@ -0,0 +1,60 @@
+from time import perf_counter
+
+class Recorder:
+    """
+    Timers and counters of the restarts of a trip.
+
+    Every function of the packing path takes an optional recorder and only measures anything when it is given,
+    with no recorder the cost is a comparison with None. RCH creates one recorder per restart and get_volumes
+    merges them into the recorder of the trip.
+
+    Timers (seconds):
+        orientation, sort_boxes, sort_PPs, is_feasible, merge, lateral_support, retry, separate_boxes, scoring.
+        retry includes the sort_PPs, is_feasible, merge and lateral_support time of the boxes it retries.
+
+    Counters:
+        restarts (restarts that ran load_boxes), boxes, placed, not_loaded, feasibility_checks, intersection_tests (placed boxes in the grid cells
+        scanned), rejected_fit, rejected_intersection, support_removed (boxes removed for lacking lateral support),
+        the PP statistics of FreeSpaces (pp_added, pp_merged...), memo_hits and memo_misses (restarts taken from the
+        RestartMemo or not) and prefix_boxes (boxes not packed again thanks to the PrefixCache, the work of those
+        boxes is not in the other counters).
+
+    Observations (sum and maximum):
+        pp_list (PPs considered for each box, the sum is the number of PPs considered), sorted_pps (PPs where
+        the box fits) and pp_peak (most PPs alive at once).
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.maxima = {}
+
+    def add_time(self, name, start):
+        # Add the time since start, a value of perf_counter taken before the phase
+        self.timers[name] = self.timers.get(name, 0.0) + perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    def merge(self, other):
+        # Aggregate the timers and counters of another recorder, e.g. one of a restart into the one of the trip
+        for name, value in other.timers.items():
+            self.timers[name] = self.timers.get(name, 0.0) + value
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, value in other.maxima.items():
+            if value > self.maxima.get(name, value - 1):
+                self.maxima[name] = value
+
+    def report(self):
+        # Flat dictionary with every timer (time_ prefix), counter and maximum (max_ prefix)
+        report = {f'time_{name}': value for name, value in self.timers.items()}
+        report.update(self.counters)
+        report.update({f'max_{name}': value for name, value in self.maxima.items()})
+
+        return report
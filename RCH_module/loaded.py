@@ -0,0 +1,74 @@
+import json
+import os
+
+from .solution_format import SolutionFile, write_solution
+
+def state_path(viaje, output_dir=None):
+    # File where get_volumes saves the state of load type 2 for load type 4, output_{viaje}.json in output_dir
+    # (soluciones by default)
+    return os.path.join(output_dir or 'soluciones', f'output_{viaje}.json')
+
+class LoadedContainer:
+    """
+    Boxes already placed in a container and its free PPs, the starting point of load type 4.
+
+    Parameters:
+        solution (list): Tuples (id, (x, y, z, length, width, height)) of the boxes already loaded.
+        PPs (list): Tuples (x, y, z, l, w, h, direction) of the free spaces left after loading them.
+
+    The state is parsed once and shared read-only by every restart, the boxes and PPs are stored as tuples so
+    they can't be modified. Each restart only copies the lists (start), the tuples themselves are never copied.
+    """
+
+    def __init__(self, solution, PPs):
+        self.solution = tuple((tuple(id), tuple(box)) for id, box in solution)
+        self.PPs = tuple(tuple(pp) for pp in PPs)
+
+    @classmethod
+    def from_result(cls, result):
+        # State after a restart, result is the tuple returned by RCH (the solution and the PPs)
+        return cls(result[3], result[5])
+
+    @classmethod
+    def from_json(cls, path):
+        # State saved by get_volumes with load type 2, see state_path
+        with open(path, 'r') as file:
+            loaded_output = json.load(file)
+
+        return cls(loaded_output['solution'], loaded_output['PPs'])
+
+    def to_json(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'solution': self.solution, 'PPs': self.PPs}, file)
+
+        return path
+
+    @classmethod
+    def from_binary(cls, path):
+        # State saved with to_binary or converted from the json with solution_format.json_to_binary
+        # The file already gives tuples, they don't have to be converted again
+        file = SolutionFile(path)
+        state = cls.__new__(cls)
+        state.solution = tuple(file.solution())
+        state.PPs = tuple(file.PPs())
+
+        return state
+
+    def to_binary(self, path):
+        return write_solution(path, self.solution, self.PPs)
+
+    def start(self):
+        # Lists of boxes and PPs for a new restart, load_boxes appends to them without touching the shared state
+        return list(self.solution), list(self.PPs)
+
+    @property
+    def x_axis(self):
+        # Length of the container already used (last box + last box length)
+        if not self.solution:
+            return 0
+
+        return max(box[0] + box[3] for id, box in self.solution)
+
+    def __len__(self):
+        return len(self.solution)
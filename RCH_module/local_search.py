@@ -0,0 +1,196 @@
+import numpy as np
+
+from .sorting import box_priority
+
+class Candidate:
+    """
+    Order and orientation of the boxes of a solution found by the local search.
+
+    Attributes:
+        order (np.ndarray): Indices of the boxes of the BoxTable in the order they are loaded.
+        length, width, priority (np.ndarray): Orientation and priority of each box of the table.
+        seed (int): Seed of the restart the search started from.
+        moves (int): Number of moves accepted since that restart.
+    """
+
+    def __init__(self, order, length, width, priority, seed, moves=0):
+        self.order = order
+        self.length = length
+        self.width = width
+        self.priority = priority
+        self.seed = seed
+        self.moves = moves
+
+    def __repr__(self):
+        return f'{self.seed}+{self.moves}'
+
+    @property
+    def key(self):
+        # Text that gives the candidate back with from_key: seed+moves, the order of the boxes and the length of
+        # each box (its orientation), e.g. '12+37:3-0-1-2:120-80-80-120'
+        return f'{self.seed}+{self.moves}:{"-".join(map(str, self.order))}:{"-".join(map(str, self.length))}'
+
+    @classmethod
+    def from_key(cls, key, table, container_width):
+        # Candidate of a key of the same trip, the width and priority of each box follow from its length
+        start, order, length = key.split(':')
+        seed, moves = start.split('+')
+        order = np.array([int(x) for x in order.split('-')], dtype=np.int64)
+        length = np.array([int(x) for x in length.split('-')], dtype=table.length.dtype)
+        if len(order) != len(table) or len(length) != len(table):
+            raise ValueError('The key is not a candidate of this trip')
+
+        width = np.where(length == table.length, table.width, table.length)
+
+        return cls(order, length, width, box_priority(width, container_width), int(seed), int(moves))
+
+def parse_seed(seed, table, container_width):
+    # Entry of the archive as written in the results, an int for a restart or the key of a Candidate
+    if isinstance(seed, str):
+        return Candidate.from_key(seed, table, container_width) if ':' in seed else int(seed)
+
+    return seed
+
+class LocalSearch:
+    """
+    Improvement stage of get_volumes that starts from the best restarts instead of sampling new ones.
+
+    Parameters:
+        share (float): Fraction of the time budget of the stopping policy reserved for the local search.
+        max_moves (int): Maximum number of moves evaluated, None for no limit (then the time budget stops it).
+        starts (int): Number of best restarts the search starts from, they are improved in turns.
+        patience (int): Stop after this many moves without improving the best solution, None to disable.
+        seed (int): Seed of the moves.
+
+    Each move changes the current order or orientation of one of the starts and is evaluated with load_boxes:
+        swap: exchange two boxes of the order.
+        block: move a block of up to 8 consecutive boxes to another position.
+        flip: rotate a box that doesn't have a fixed orientation.
+        reinsert: move a box that was not loaded to an earlier position.
+    A move is kept if the solution is at least as good for the objective of the load type, so the search can cross
+    plateaus of equal scores.
+    """
+
+    def __init__(self, share=0.3, max_moves=2000, starts=3, patience=None, seed=0):
+        if not 0 <= share < 1:
+            raise ValueError('share has to be between 0 and 1')
+
+        self.share = share
+        self.max_moves = max_moves
+        self.starts = starts
+        self.patience = patience
+        self.seed = seed
+        self.moves = 0
+        self.accepted = 0
+        self.improvements = 0
+
+    def _neighbour(self, candidate, table, container_width, not_loaded, rng):
+        order = candidate.order.copy()
+        length = candidate.length
+        width = candidate.width
+        priority = candidate.priority
+        n = len(order)
+
+        moves = ['swap', 'block']
+        if (table.fixed == 0).any():
+            moves.append('flip')
+        if not_loaded:
+            moves.append('reinsert')
+
+        move = moves[rng.integers(len(moves))]
+
+        if move == 'swap':
+            i, j = rng.choice(n, 2, replace=False)
+            order[i], order[j] = order[j], order[i]
+
+        elif move == 'block':
+            i = rng.integers(n)
+            k = rng.integers(1, min(8, n - i) + 1)
+            block = order[i:i + k]
+            rest = np.delete(order, np.arange(i, i + k))
+            p = rng.integers(len(rest) + 1)
+            order = np.concatenate([rest[:p], block, rest[p:]])
+
+        elif move == 'flip':
+            box = rng.choice(np.flatnonzero(table.fixed == 0))
+            length = length.copy()
+            width = width.copy()
+            length[box], width[box] = width[box], length[box]
+            priority = priority.copy()
+            priority[box] = box_priority(width[box], container_width)
+
+        else:
+            # The box goes anywhere before its current position
+            i = int(np.flatnonzero(np.isin(order, not_loaded))[rng.integers(len(not_loaded))])
+            if i == 0:
+                return None
+            p = rng.integers(i)
+            order = np.insert(np.delete(order, i), p, order[i])
+
+        return Candidate(order, length, width, priority, candidate.seed, candidate.moves + 1)
+
+    def run(self, evaluate, table, container_width, starts, key, remaining=None, recorder=None):
+        """
+        Improve the starts until the moves, the time or the patience run out.
+
+        Parameters:
+            evaluate (callable): Function that loads a Candidate and returns the same tuple as RCH.
+            table (BoxTable): Boxes of the trip.
+            container_width (int): Width of the container, used for the priority of the flipped boxes.
+            starts (list): Candidates of the best restarts.
+            key (callable): Objective of the load type, a bigger key is a better solution.
+            remaining (callable): Seconds left of the time budget, it can also return None if there is no time budget.
+            recorder (Recorder): If given the moves, accepted moves and improvements are counted in it.
+
+        Returns:
+            generator: Tuples (scores, candidate) each time one of the starts improves.
+        """
+        rng = np.random.default_rng(self.seed)
+        self.moves = self.accepted = self.improvements = 0
+        if not starts or len(table) < 2:
+            return
+
+        # Current candidate of each start with its key and the boxes it doesn't load
+        index = {id: i for i, id in enumerate(table.ids)}
+        current = []
+        for candidate in starts:
+            result = evaluate(candidate)
+            current.append((candidate, key(result[0:3]), [index[x] for x in result[4]]))
+
+        best = max(x[1] for x in current)
+        since_improvement = 0
+        while self.max_moves is None or self.moves < self.max_moves:
+            left = remaining() if remaining is not None else None
+            if left is not None and left <= 0:
+                break
+            if self.patience is not None and since_improvement >= self.patience:
+                break
+
+            turn = self.moves % len(current)
+            candidate, current_key, not_loaded = current[turn]
+            self.moves += 1
+            since_improvement += 1
+
+            neighbour = self._neighbour(candidate, table, container_width, not_loaded, rng)
+            if neighbour is None:
+                continue
+
+            result = evaluate(neighbour)
+            scores = result[0:3]
+            neighbour_key = key(scores)
+            if neighbour_key >= current_key:
+                self.accepted += 1
+                current[turn] = (neighbour, neighbour_key, [index[x] for x in result[4]])
+
+                if neighbour_key > current_key:
+                    self.improvements += 1
+                    yield scores, neighbour
+
+                if neighbour_key > best:
+                    best = neighbour_key
+                    since_improvement = 0
+
+        if recorder is not None:
+            recorder.count('ls_moves', self.moves)
+            recorder.count('ls_accepted', self.accepted)
+            recorder.count('ls_improvements', self.improvements)
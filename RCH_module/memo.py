@@ -0,0 +1,81 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+def _geometry(id, hmap):
+    # Relative positions of the boxes combined into a box, None for a single box
+    if id not in hmap:
+        return None
+
+    return (id[0].endswith('_H'), tuple((_geometry(box, hmap), tuple(position)) for box, position in hmap[id]))
+
+def box_classes(table, hmap):
+    """
+    Class of each box of the table, boxes of the same class can be exchanged without changing the scores.
+
+    Two boxes are in the same class if they have the same dimensions, are both stackable or not and, for the
+    boxes combined in join_box, the boxes inside are placed in the same way. The class is the first row of the
+    table with that description.
+    """
+    classes = {}
+    return np.array([classes.setdefault((table.length[i], table.width[i], table.height[i], table.remontable[i],
+                                          _geometry(id, hmap)), i) for i, id in enumerate(table.ids)], dtype=np.int64)
+
+class RestartMemo:
+    """
+    LRU memo of the scores and the number of boxes not loaded of the restarts, by the signature of the boxes they load.
+
+    Parameters:
+        max_size (int): Maximum number of signatures kept, the least recently used ones are dropped above it.
+            With 0 nothing is kept.
+
+    The signature of a restart is the class of each box in the order they are loaded and their orientation, so two
+    restarts with the same signature load the same boxes in the same places and have the same scores, only the ids
+    can change. A restart whose signature is in the memo doesn't have to run load_boxes. start has to be called
+    for each trip. search keeps the memo in its own process and looks the seeds up in their order before they are
+    sent to the workers, so the hits don't depend on the number of workers.
+    """
+
+    def __init__(self, max_size=20000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.classes = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, table, hmap):
+        # Forget the restarts of the previous trip and compute the classes of the boxes of this one
+        self.entries.clear()
+        self.classes = box_classes(table, hmap)
+        self.hits = 0
+        self.misses = 0
+
+    def signature(self, order, length):
+        # The width and priority of a box follow from its length, the order and the lengths are enough
+        return hashlib.blake2b(self.classes[order].tobytes() + length[order].tobytes(), digest_size=16).digest()
+
+    def get(self, signature):
+        # Entry of the signature (the scores and boxes not loaded of the restart) or None if it is not in the memo
+        entry = self.entries.get(signature)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(signature)
+        return entry
+
+    def put(self, signature, entry):
+        if self.max_size <= 0:
+            return
+
+        self.entries[signature] = entry
+        self.entries.move_to_end(signature)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
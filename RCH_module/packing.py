@@ -1,13 +1,17 @@
-import json
+from time import perf_counter
+import numpy as np
 
-def score_point(x, y, z, l, w, h, current_solution):
+from .loaded import LoadedContainer, state_path
+from .container import ContainerSpec
+
+def score_point(x, y, z, l, w, h, current_solution, container_width):
     left_support = False
     right_support = False
 
     # Check for wall support
     if y == 0 or y + w == 0:  # Left wall
         left_support = True
-    if y + w == 244 or y == 244:  # Right wall
+    if y + w == container_width or y == container_width:  # Right wall
         right_support = True
 
     left_support = any(
@@ -22,42 +26,262 @@ def score_point(x, y, z, l, w, h, current_solution):
     # Higher score for positions with support on both sides
     return (2 if left_support and right_support else 1 if left_support or right_support else 0)
 
-def sort_PPs(box, PPs, load_type, solutions):
-    # Potential points sorting
-    PPs_coverage = []
+class PPTable:
+    """
+    Potential points stored as columns (x, y, z, l, w, h and direction) so they can be scored all at once.
 
-    for pp in PPs:
-        box_area = box[0] * box[1]
-        pp_area = abs(pp[3] * pp[4])  # Calculate the area of the potential point
+    Parameters:
+        PPs (list): List of tuples (x, y, z, l, w, h, direction) where direction is 'left' or 'right'.
 
-        #support = 100*score_point(pp[0], pp[1], pp[2], box[0], box[1], box[2], solutions)
-        support = 1
-        # In this case, coverage is the ratio of widths
-        if pp_area > 0:
-            coverage = box_area/pp_area * 100
-        else:
-            coverage = 0
-        
-        scoring = coverage+support
-        # We want to prioritize loading the sides of the containers so any PPs that are on the side of the container are given type 1
-        if pp[1] == 0 or pp[1] == 244 or 244 - (pp[1] + box[1]) < 6:
-            pp_type = 1
-        else:
-            pp_type = 0
+    It behaves like the list of PPs: iterating gives the tuples in the order they were added, and remove deletes
+    the first PP equal to the given one. Removed PPs are only marked as dead until the table is compacted.
+    """
 
-        PPs_coverage.append((pp, scoring, pp_type))
+    def __init__(self, PPs=()):
+        self.data = np.zeros((64, 7), dtype=np.int64)
+        self.alive = np.zeros(64, dtype=bool)
+        self.size = 0
+        self.count = 0
+
+        # The tuples are kept next to the columns (None once removed) and every PP value points to its rows
+        self.tuples = []
+        self._reset_index()
+
+        for pp in PPs:
+            self.append(pp)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (pp for pp in self.tuples if pp is not None)
+
+    def append(self, pp):
+        # Double the capacity when the table is full
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+            self.alive = np.concatenate([self.alive, np.zeros_like(self.alive)])
+
+        self.data[self.size] = (*pp[0:6], 1 if pp[6] == 'right' else 0)
+        self.alive[self.size] = True
+        self.tuples.append(pp)
+        self._index(pp, self.size)
+        self.size += 1
+        self.count += 1
+
+    def remove(self, pp):
+        rows = self.rows.get(pp)
+        if not rows:
+            raise ValueError(f'{pp} is not in the PPs')
+
+        self._remove_row(rows[0])
+        self._compact()
+
+    def _index(self, pp, row):
+        self.rows.setdefault(pp, []).append(row)
+
+    def _remove_row(self, row):
+        pp = self.tuples[row]
+        rows = self.rows[pp]
+        rows.remove(row)
+        if not rows:
+            del self.rows[pp]
+
+        self.alive[row] = False
+        self.tuples[row] = None
+        self.count -= 1
+
+    def _compact(self):
+        # When most of the rows are dead we compact the table keeping the order of the PPs
+        if self.size > 64 and self.count < self.size // 2:
+            live = np.flatnonzero(self.alive[:self.size])
+            self.data[:self.count] = self.data[live]
+            self.alive[:self.count] = True
+            self.alive[self.count:self.size] = False
+            self.size = self.count
+
+            self.tuples = [pp for pp in self.tuples if pp is not None]
+            self._reset_index()
+            for row, pp in enumerate(self.tuples):
+                self._index(pp, row)
+
+    def _reset_index(self):
+        self.rows = {}
+
+    def copy(self):
+        # Independent table with the same PPs in the same rows, the tuples themselves are shared
+        table = self.__class__.__new__(self.__class__)
+        table.data = self.data.copy()
+        table.alive = self.alive.copy()
+        table.size = self.size
+        table.count = self.count
+        table.tuples = list(self.tuples)
+        table.rows = {pp: list(rows) for pp, rows in self.rows.items()}
+
+        return table
+
+    def columns(self):
+        # Views of the x, y, z, l, w, h and direction columns, dead rows included
+        return self.data[:self.size].T
+
+    def tolist(self):
+        return list(self)
+
+class FreeSpaces(PPTable):
+    """
+    Lifecycle manager of the potential points (free spaces) used while packing a container.
 
-    # Depending on the load type we sort one way or another
+    Parameters:
+        PPs (list): List of tuples (x, y, z, l, w, h, direction) where direction is 'left' or 'right'.
+        index (SpatialIndex): Spatial index of the boxes already placed in the container.
+        prune_dominated (bool): Drop a PP if another one with the same corner and direction is at least as big.
+
+    On top of the PP table it removes the PPs that can never be used: PPs with no space left, PPs whose corner
+    is inside a placed box (any box placed there would intersect it) and, optionally, dominated PPs. Top spaces
+    are merged with a lookup by x and y instead of a scan of all the PPs. The stats dictionary counts the PPs
+    added, pruned for each reason, merged and used, and the peak size of the list.
+    """
+
+    def __init__(self, PPs=(), index=None, prune_dominated=True):
+        self.index = index if index is not None else SpatialIndex()
+        self.prune_dominated = prune_dominated
+        self.stats = {'added': 0, 'used': 0, 'merged': 0, 'pruned_empty': 0, 'pruned_covered': 0,
+                      'pruned_dominated': 0, 'peak': 0}
+        super().__init__(PPs)
+
+    def _reset_index(self):
+        super()._reset_index()
+        self.by_corner = {}
+        self.by_x = {}
+        self.by_y = {}
+
+    def copy(self, index=None):
+        # The copy uses the given spatial index, it has to be a copy of the index of this table
+        spaces = super().copy()
+        spaces.index = index if index is not None else self.index.copy()
+        spaces.prune_dominated = self.prune_dominated
+        spaces.stats = dict(self.stats)
+        spaces.by_corner = {key: list(rows) for key, rows in self.by_corner.items()}
+        spaces.by_x = {key: list(rows) for key, rows in self.by_x.items()}
+        spaces.by_y = {key: list(rows) for key, rows in self.by_y.items()}
+
+        return spaces
+
+    def _index(self, pp, row):
+        super()._index(pp, row)
+        self.by_corner.setdefault((pp[0], pp[1], pp[2], pp[6]), []).append(row)
+        self.by_x.setdefault(pp[0], []).append(row)
+        self.by_y.setdefault(pp[1], []).append(row)
+
+    def _live(self, rows):
+        tuples = self.tuples
+        return [row for row in rows if tuples[row] is not None]
+
+    def append(self, pp):
+        self.stats['added'] += 1
+        x, y, z, l, w, h, direction = pp
+
+        # PPs with no space left can't fit any box
+        if l <= 0 or w == 0 or h <= 0:
+            self.stats['pruned_empty'] += 1
+            return
+
+        # If the corner is inside a placed box any box placed there would intersect it
+        if self.index.covers(x, y, z, direction == 'right'):
+            self.stats['pruned_covered'] += 1
+            return
+
+        # PPs with the same corner and direction only differ in size, we keep the biggest one
+        if self.prune_dominated:
+            same_corner = self._live(self.by_corner.get((x, y, z, direction), []))
+            for row in same_corner:
+                l1, w1, h1 = self.tuples[row][3:6]
+                if l1 >= l and abs(w1) >= abs(w) and h1 >= h:
+                    self.stats['pruned_dominated'] += 1
+                    return
+
+            for row in same_corner:
+                l1, w1, h1 = self.tuples[row][3:6]
+                if l1 <= l and abs(w1) <= abs(w) and h1 <= h:
+                    self.stats['pruned_dominated'] += 1
+                    self._remove_row(row)
+
+            self._compact()
+
+        super().append(pp)
+        self.stats['peak'] = max(self.stats['peak'], self.count)
+
+    def use(self, pp):
+        # Remove the PP where a box has been placed
+        self.stats['used'] += 1
+        self.remove(pp)
+
+    def place(self, solution):
+        # Remove the PPs whose corner is covered by the box that has just been placed
+        x, y, z, l, w, h = solution[1]
+        y_min, y_max = min(y, y + w), max(y, y + w)
+
+        # The corners are tested all at once on the columns. PPs going towards -y (right) are inside if
+        # y_min < y1 <= y_max, as the corners are whole cm that is y_min <= y1 - 1 < y_max
+        x1, y1, z1, l1, w1, h1, right = self.columns()
+        y1 = y1 - right
+        covered = (self.alive[:self.size] & (x <= x1) & (x1 < x + l) & (y_min <= y1) & (y1 < y_max)
+                   & (z <= z1) & (z1 < z + h))
+
+        for row in np.flatnonzero(covered).tolist():
+            self.stats['pruned_covered'] += 1
+            self._remove_row(row)
+
+        self._compact()
+
+    def merge(self, pp):
+        # Same as merge but only over the PPs at the same y (adjacent in length) or at the same x (adjacent in width)
+        rows = self._live(self.by_y.get(pp[1], [])) + self._live(self.by_x.get(pp[0], []))
+        new_pp, old_pp = merge(pp, [self.tuples[row] for row in sorted(set(rows))])
+
+        if old_pp is not None:
+            self.stats['merged'] += 1
+
+        return new_pp, old_pp
+
+def sort_PPs(box, PPs, load_type, solutions, nominal_width, fit=None):
+    # Potential points sorting, fit are the dimensions (l, w, h) in which the box will be tried, by default the ones of the box
+    # The PPs on the sides are found with the nominal width of the container
+    if not isinstance(PPs, PPTable):
+        PPs = PPTable(PPs)
+
+    if fit is None:
+        fit = box[0:3]
+
+    x, y, z, l, w, h, direction = PPs.columns()
+
+    # If the box doesn't fit in a PP it can't be feasible so we drop those PPs before sorting
+    rows = np.flatnonzero(PPs.alive[:PPs.size] & (l >= fit[0]) & (np.abs(w) >= abs(fit[1])) & (h >= fit[2]))
+
+    # We want to prioritize loading the sides of the containers so any PPs that are on the side of the container are given type 1
+    y = y[rows]
+    pp_type = (y == 0) | (y == nominal_width) | (nominal_width - (y + box[1]) < 6)
+
+    # Depending on the load type we sort one way or another, the sort is stable so ties keep the order of the PPs
     if load_type == 3:
-        PPs_coverage = sorted(PPs_coverage, key=lambda x: (x[2], -x[0][2]), reverse=True)
-        sorted_PPs = [x[0] for x in PPs_coverage]
-    
+        order = np.lexsort((z[rows], ~pp_type))
+
     else:
+        # Calculate the area of the potential points, the PPs with no area have no coverage
+        pp_area = np.abs(l[rows] * w[rows]).astype(np.float64)
+        pp_area[pp_area == 0] = np.inf
+
+        #support = 100*score_point(pp[0], pp[1], pp[2], box[0], box[1], box[2], solutions, nominal_width)
+        support = 1
+        # In this case, coverage is the ratio of widths
+        coverage = box[0] * box[1] / pp_area * 100
+        scoring = coverage + support
+
         # Sort PPs by type and then coverage in descending order
-        PPs_coverage = sorted(PPs_coverage, key=lambda x: (x[2], x[1] -x[0][0]), reverse=True)
-        sorted_PPs = [x[0] for x in PPs_coverage]
+        order = np.lexsort((x[rows] - scoring, ~pp_type))
 
-    return sorted_PPs
+    tuples = PPs.tuples
+    return [tuples[i] for i in rows[order].tolist()]
 
 def check_intersection(box1, box2):
     x1, y1, z1, l1, w1, h1 = box1[1][0:6]
@@ -85,7 +309,77 @@ def check_intersection(box1, box2):
 
     return intersection
 
-def is_feasible(pp, l, w, h, solutions):
+class SpatialIndex:
+    """
+    Uniform grid along the length of the container (x axis) over the boxes that are already placed.
+
+    Parameters:
+        solutions (list): List of tuples (id, box) already placed in the container.
+        cell (int): Length in cm of each cell of the grid.
+
+    Each box is stored in every cell it touches with its bounds already normalized (x_min, x_max, y_min, y_max,
+    z_min, z_max), so boxes placed against the right wall with a negative width don't need any special case.
+    """
+
+    def __init__(self, solutions=(), cell=50):
+        self.cell = cell
+        self.cells = {}
+
+        # Number of placed boxes in the cells scanned by intersects
+        self.tests = 0
+
+        for solution in solutions:
+            self.add(solution)
+
+    def copy(self):
+        index = SpatialIndex.__new__(SpatialIndex)
+        index.cell = self.cell
+        index.cells = {cell: list(boxes) for cell, boxes in self.cells.items()}
+        index.tests = self.tests
+
+        return index
+
+    def _bounds(self, solution):
+        x, y, z, l, w, h = solution[1][0:6]
+        return (x, x + l, min(y, y + w), max(y, y + w), z, z + h)
+
+    def _cells(self, x, l):
+        return range(int(x // self.cell), int((x + l) // self.cell) + 1)
+
+    def add(self, solution):
+        bounds = self._bounds(solution)
+        for cell in self._cells(bounds[0], bounds[1] - bounds[0]):
+            self.cells.setdefault(cell, []).append(bounds)
+
+    def remove(self, solution):
+        bounds = self._bounds(solution)
+        for cell in self._cells(bounds[0], bounds[1] - bounds[0]):
+            self.cells[cell].remove(bounds)
+
+    def covers(self, x, y, z, right=False):
+        # True if the point is inside a placed box, a box growing from it (towards -y if right) would always intersect it
+        for x_min, x_max, y_min, y_max, z_min, z_max in self.cells.get(int(x // self.cell), ()):
+            inside_y = y_min < y <= y_max if right else y_min <= y < y_max
+            if x_min <= x < x_max and z_min <= z < z_max and inside_y:
+                return True
+
+        return False
+
+    def intersects(self, x, y, z, l, w, h):
+        # Same test as check_intersection but only against the boxes in the cells touched by the new box
+        y_min = min(y, y + w)
+        y_max = max(y, y + w)
+
+        for cell in self._cells(x, l):
+            boxes = self.cells.get(cell, ())
+            self.tests += len(boxes)
+            for x1_min, x1_max, y1_min, y1_max, z1_min, z1_max in boxes:
+                if x < x1_max and x + l > x1_min and y_min < y1_max and y_max > y1_min and z < z1_max and z + h > z1_min:
+                    return True
+
+        return False
+
+def is_feasible(pp, l, w, h, solutions, index=None):
     # For a box to be in a feasible PP it has to fit and there can be no intersections with other boxes
     x, y, z = pp[0:3]
 
@@ -93,6 +387,9 @@ def is_feasible(pp, l, w, h, solutions):
     if pp[3] < l or abs(pp[4]) < abs(w) or pp[5] < h:
         return False
 
+    # If we have a spatial index we only check the boxes that are close to the PP
+    if index is not None:
+        return not index.intersects(x, y, z, l, w, h)
     
     # Check for intersections with the boxes that are already loaded
     for i in range(len(solutions)):
@@ -186,15 +483,110 @@ def lateral_support(current_solution, pending, container_width):
 
     return pending
 
-def retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes):
+class LateralSupport:
+    """
+    Incremental version of lateral_support that keeps the pending boxes until they have lateral support.
+
+    Parameters:
+        solutions (list): List of tuples (id, box) already placed in the container.
+        container_width (int): Total width of the container to handle wall conditions.
+
+    Placed and pending boxes are indexed by the y coordinate of their side faces, so placing a box only checks
+    the pending boxes it can touch instead of every pending box against every placed box. A pending box is
+    validated when it has support on both sides, from the walls or from an adjacent box, the same rule as lateral_support.
+    """
+
+    def __init__(self, solutions, container_width):
+        self.container_width = container_width
+
+        # Pending boxes in the order they were added, with their own face indexes
+        self.pending = {}
+        self.pending_start = {}
+        self.pending_end = {}
+
+        # Side faces of the placed boxes, y for the start of the box and y + w for the end
+        self.placed_start = {}
+        self.placed_end = {}
+
+        for solution in solutions:
+            self._add_placed(solution)
+
+    def copy(self):
+        support = LateralSupport.__new__(LateralSupport)
+        support.container_width = self.container_width
+        support.pending = dict(self.pending)
+        for name in ('pending_start', 'pending_end', 'placed_start', 'placed_end'):
+            setattr(support, name, {y: list(items) for y, items in getattr(self, name).items()})
+
+        return support
+
+    def _add_placed(self, solution):
+        x, y, z, l, w, h = solution[1]
+        self.placed_start.setdefault(y, []).append(solution)
+        self.placed_end.setdefault(y + w, []).append(solution)
+
+    def _touches(self, box, solution):
+        # Same adjacency condition as in lateral_support, box is pending and solution is already placed
+        x, y, z, l, w, h = box
+        x2, y2, z2, l2, w2, h2 = solution[1]
+        return (y2 == y + w or y2 + w2 == y) and z < z2 + h2 and x < x2 + l2 and x + l > x2
+
+    def _validate(self, item):
+        x, y, z, l, w, h = item[1]
+        del self.pending[item]
+        self.pending_start[y].remove(item)
+        self.pending_end[y + w].remove(item)
+
+    def place(self, solution, pending=False):
+        # Register a placed box and validate the pending boxes it touches, if pending is True the box
+        # needs lateral support itself
+        x, y, z, l, w, h = solution[1]
+        self._add_placed(solution)
+
+        for item in self.pending_end.get(y, []) + self.pending_start.get(y + w, []):
+            if item in self.pending and self._touches(item[1], solution):
+                self._validate(item)
+
+        if pending:
+            self.pending[solution] = None
+            self.pending_start.setdefault(y, []).append(solution)
+            self.pending_end.setdefault(y + w, []).append(solution)
+
+            # Check for wall support
+            left_wall = y == 0 or y + w == 0
+            right_wall = y + w == self.container_width or y == self.container_width
+
+            # Check for support from the boxes already placed
+            neighbours = self.placed_start.get(y + w, []) + self.placed_end.get(y, [])
+            if (left_wall and right_wall) or any(self._touches(solution[1], x) for x in neighbours):
+                self._validate(solution)
+
+def retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes, index=None, recorder=None):
 
     container_length, container_width, container_height = container_dimensions
-    pending = []
+    nominal_width = ContainerSpec.of(container_dimensions).nominal_width
+
+    # Spatial index of the boxes already placed for the feasibility checks
+    if index is None:
+        index = SpatialIndex(solutions)
+
+    if not isinstance(PPs, FreeSpaces):
+        PPs = FreeSpaces(PPs, index)
+
+    # Boxes waiting for lateral support
+    support = LateralSupport(solutions, container_width)
     final_not_loaded = {}
 
     for id, box in not_loaded.items():
         # Sort the PPs according to the current box
-        sorted_PPs = sort_PPs(box, PPs, 3, solutions)
+        if recorder is not None:
+            recorder.observe('pp_list', len(PPs))
+            start = perf_counter()
+        sorted_PPs = sort_PPs(box, PPs, 3, solutions, nominal_width, fit=(box[1], box[0], box[2]))
+        if recorder is not None:
+            recorder.add_time('sort_PPs', start)
+            recorder.observe('sorted_pps', len(sorted_PPs))
+            recorder.count('rejected_fit', len(PPs) - len(sorted_PPs))
         solution = None
 
         # Loop over each PP to try to place the box in it
@@ -207,21 +599,40 @@ def retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes):
                 l, w, h = box[1], box[0], box[2]
             
             # If the PP, box combination is feasible we will place the box
-            if is_feasible(pp, l, w, h, solutions):
+            if recorder is not None:
+                start = perf_counter()
+            feasible = is_feasible(pp, l, w, h, solutions, index)
+            if recorder is not None:
+                recorder.add_time('is_feasible', start)
+                recorder.count('feasibility_checks')
+                if not feasible:
+                    fits = pp[3] >= l and abs(pp[4]) >= abs(w) and pp[5] >= h
+                    recorder.count('rejected_intersection' if fits else 'rejected_fit')
+
+            if feasible:
                 
                 # Generate the solution
                 solution = (id,(x, y, z, l, w, h))
                 
-                PPs.remove(pp)
+                PPs.use(pp)
+
+                # Register the box so the PPs it covers are removed
+                solutions.append(solution)
+                index.add(solution)
+                PPs.place(solution)
 
                 # Create the new PPs to be added to the list
                 front_pp = (x + l, y, z, pp[3]-l, pp[4], pp[5], pp[6])
                 side_pp = (x, y + w, z, l, pp[4]-w, pp[5], pp[6])
                 top_pp = (x, y, z + h, l, w, pp[5]-h, pp[6])
-                right_corner_pp = (x + l, container_width, z, container_length-(x+l), -244, pp[5], 'right')
+                right_corner_pp = (x + l, container_width, z, container_length-(x+l), -nominal_width, pp[5], 'right')
 
                 # Top pp is merged with adjacent spaces
-                top_pp, old_pp = merge(top_pp, PPs)
+                if recorder is not None:
+                    start = perf_counter()
+                top_pp, old_pp = PPs.merge(top_pp)
+                if recorder is not None:
+                    recorder.add_time('merge', start)
                
                 if old_pp is not None:
                     PPs.remove(old_pp)
@@ -234,15 +645,15 @@ def retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes):
                 if box[4] == 1:
                     PPs.append(top_pp)
 
-                if 244 - (y + w) < 30 and z == 0:
+                if nominal_width - (y + w) < 30 and z == 0:
                     PPs.append(right_corner_pp)
 
-                solutions.append(solution)          
-
-                if z > 0 and l > w and h > w:
-                    pending.append(solution)
-
-                pending = lateral_support(solutions, pending, container_width)
+                # Boxes that are placed on top of others and are taller than wide need lateral support
+                if recorder is not None:
+                    start = perf_counter()
+                support.place(solution, z > 0 and l > w and h > w)
+                if recorder is not None:
+                    recorder.add_time('lateral_support', start)
 
                 break
                 
@@ -251,60 +662,98 @@ def retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes):
         if solution is None: 
             final_not_loaded[id] = box
 
-    for item in pending:
+    if recorder is not None:
+        recorder.count('support_removed', len(support.pending))
+
+    for item in support.pending:
         final_not_loaded[item[0]] = boxes[item[0]]
         solutions.remove(item)
+        index.remove(item)
     
-    return solutions, final_not_loaded, PPs
-
-def break_combination(id, current_pp, PPs, hmap):
-    box1 = []
-    box2 = []
-    for pp in PPs:
-        if pp[0] + pp[3] >= current_pp[0] and pp[2] == current_pp[2]:
-            pass
-
-def load_boxes(boxes, container_dimensions, load_type, viaje):
-    container_length, container_width, container_height = container_dimensions
+    return solutions, final_not_loaded, PPs.tolist()
 
-    # Initialize two PPs for the container
-    if load_type == 4:
-
-        # Load the JSON file
-        with open(f"soluciones/output_{viaje}.json", "r") as file:
-            loaded_output = json.load(file)
-        
-        # Convert solutions lists back to tuples
-        solutions = loaded_output['solution']
-        solutions = [(tuple(item[0]), tuple(item[1])) for item in solutions]
-
-        PPs = loaded_output['PPs']
-        PPs = [tuple(item) for item in PPs]
+class Packer:
+    """
+    State of a container while its boxes are loaded one by one, the packing step of load_boxes.
 
-        last_box = max(solutions, key= lambda x: x[1][0] + x[1][3])[1]
-        x_axis = last_box[0] + last_box[3]
+    Parameters:
+        container_dimensions (ContainerSpec): Dimensions of the container, a list [length, width, height] is also
+            accepted and then its width is the nominal width.
+        load_type (int): Load type, it decides how the PPs are sorted.
+        viaje (str): Trip code, only used to read soluciones/output_{viaje}.json if load type 4 has no state.
+        state (LoadedContainer): Boxes already in the container for load type 4.
+
+    The state (solutions, PPs, spatial index, boxes waiting for lateral support and boxes not loaded) only
+    depends on the boxes placed so far, copy gives an independent packer that continues from the same point.
+    """
 
-        not_loaded = {}
+    def __init__(self, container_dimensions, load_type, viaje=None, state=None):
+        self.container_dimensions = ContainerSpec.of(container_dimensions)
+        self.load_type = load_type
+        container_length, container_width, container_height = container_dimensions
 
-    else:
-        PPs = [(0, container_width, 0, container_length, -container_width, container_height, 'right'), (0, 0, 0, container_length, container_width, container_height, 'left')]
-        
-        solutions = []
-        not_loaded = {}
+        # Initialize two PPs for the container
+        if load_type == 4:
+            if state is None:
+                state = LoadedContainer.from_json(state_path(viaje))
 
-    pending = []
-    # Loop over each box and try to place it
-    for id, box in boxes.items():
+            # Each restart gets its own lists, the boxes and PPs of the state are shared
+            solutions, PPs = state.start()
 
-        suffix = id[0][-2:len(id[0])]
-        if suffix == '_W':
-            combined = True
         else:
-            combined = False
+            PPs = [(0, container_width, 0, container_length, -container_width, container_height, 'right'), (0, 0, 0, container_length, container_width, container_height, 'left')]
+            solutions = []
+
+        self.solutions = solutions
+        self.not_loaded = {}
+
+        # Spatial index of the boxes already placed for the feasibility checks
+        self.index = SpatialIndex(solutions)
+
+        # The PPs are kept in a columnar table so they can be sorted for each box at once, the free space manager
+        # removes the PPs that can't be used anymore
+        self.PPs = FreeSpaces(PPs, self.index)
+
+        # Boxes waiting for lateral support
+        self.support = LateralSupport(solutions, container_width)
+
+    def copy(self):
+        packer = Packer.__new__(Packer)
+        packer.container_dimensions = self.container_dimensions
+        packer.load_type = self.load_type
+        packer.solutions = list(self.solutions)
+        packer.not_loaded = dict(self.not_loaded)
+        packer.index = self.index.copy()
+        packer.PPs = self.PPs.copy(packer.index)
+        packer.support = self.support.copy()
+
+        return packer
+
+    def reset_stats(self):
+        # Start the PP statistics and the intersection tests from 0 but keep the peak of PPs, e.g. for a packer
+        # resumed from a prefix, the boxes of the prefix were already counted by the restart that packed them
+        peak = self.PPs.stats['peak']
+        self.PPs.stats = dict.fromkeys(self.PPs.stats, 0)
+        self.PPs.stats['peak'] = peak
+        self.index.tests = 0
+
+    def place(self, id, box, recorder=None):
+        # Try to place a box in the best feasible PP, it returns False if the box goes to not_loaded
+        container_length, container_width, container_height = self.container_dimensions
+        nominal_width = self.container_dimensions.nominal_width
+        PPs = self.PPs
+        solutions = self.solutions
+        index = self.index
 
         # Sort the PPs according to the current box
-        sorted_PPs = sort_PPs(box, PPs, load_type, solutions)
-        solution = None
+        if recorder is not None:
+            recorder.observe('pp_list', len(PPs))
+            start = perf_counter()
+        sorted_PPs = sort_PPs(box, PPs, self.load_type, solutions, nominal_width)
+        if recorder is not None:
+            recorder.add_time('sort_PPs', start)
+            recorder.observe('sorted_pps', len(sorted_PPs))
+            recorder.count('rejected_fit', len(PPs) - len(sorted_PPs))
 
         # Loop over each PP to try to place the box in it
         for pp in sorted_PPs:
@@ -316,28 +765,42 @@ def load_boxes(boxes, container_dimensions, load_type, viaje):
                 l, w, h = box[0], box[1], box[2]
 
             # If the PP, box combination is feasible we will place the box
-            if is_feasible(pp, l, w, h, solutions):
-                
+            if recorder is not None:
+                start = perf_counter()
+            feasible = is_feasible(pp, l, w, h, solutions, index)
+            if recorder is not None:
+                recorder.add_time('is_feasible', start)
+                recorder.count('feasibility_checks')
+                if not feasible:
+                    fits = pp[3] >= l and abs(pp[4]) >= abs(w) and pp[5] >= h
+                    recorder.count('rejected_intersection' if fits else 'rejected_fit')
+
+            if feasible:
+
                 # Generate the solution
-                '''if combined == True:
-                    solution = break_combination()
-                else:
-                    solution = (id,(x, y, z, l, w, h))'''
-                
                 solution = (id,(x, y, z, l, w, h))
-                
-                PPs.remove(pp)
+
+                PPs.use(pp)
+
+                # Register the box so the PPs it covers are removed
+                solutions.append(solution)
+                index.add(solution)
+                PPs.place(solution)
 
                 # Create the new PPs to be added to the list
                 front_pp = (x + l, y, z, pp[3]-l, pp[4], pp[5], pp[6])
                 side_pp = (x, y + w, z, l, pp[4]-w, pp[5], pp[6])
                 top_pp = (x, y, z + h, l, w, pp[5]-h, pp[6])
-                right_corner_pp = (x + l, container_width, z, container_length-(x+l), -244, pp[5], 'right')
-                left_corner_pp = (x + l, 0, z, container_length-(x+l), 244, pp[5], 'left')
+                right_corner_pp = (x + l, container_width, z, container_length-(x+l), -nominal_width, pp[5], 'right')
+                left_corner_pp = (x + l, 0, z, container_length-(x+l), nominal_width, pp[5], 'left')
 
                 # Top pp is merged with adjacent spaces
-                top_pp, old_pp = merge(top_pp, PPs)
-               
+                if recorder is not None:
+                    start = perf_counter()
+                top_pp, old_pp = PPs.merge(top_pp)
+                if recorder is not None:
+                    recorder.add_time('merge', start)
+
                 if old_pp is not None:
                     PPs.remove(old_pp)
 
@@ -349,32 +812,84 @@ def load_boxes(boxes, container_dimensions, load_type, viaje):
                 if box[4] == 1:
                     PPs.append(top_pp)
 
-                if 244 - (y + w) < 30 and z == 0:
+                if nominal_width - (y + w) < 30 and z == 0:
                     PPs.append(right_corner_pp)
-                
+
                 if (y + w) < 30 and z == 0 and pp[6] == 'right':
                     PPs.append(left_corner_pp)
 
+                # Boxes that are placed on top of others and are taller than wide need lateral support
+                if recorder is not None:
+                    start = perf_counter()
+                self.support.place(solution, z > 0 and l > w and h > w)
+                if recorder is not None:
+                    recorder.add_time('lateral_support', start)
 
-                solutions.append(solution)
-
-                if z > 0 and l > w and h > w:
-                    pending.append(solution)
+                return True
 
-                pending = lateral_support(solutions, pending, container_width)
+        # If the box is not loaded we add it to the not_loaded dictionary
+        self.not_loaded[id] = box
+        return False
 
-                break
-                
+    def finish(self, boxes, recorder=None):
+        # Remove the boxes without lateral support and retry the boxes not loaded, the packer can't be used after it
+        solutions = self.solutions
+        not_loaded = self.not_loaded
+        index = self.index
+        spaces = self.PPs
+
+        # Remove not validated boxes from solutions
+        if recorder is not None:
+            recorder.count('support_removed', len(self.support.pending))
+
+        for item in self.support.pending:
+            not_loaded[item[0]] = boxes[item[0]]
+            solutions.remove(item)
+            index.remove(item)
+
+        if recorder is not None:
+            start = perf_counter()
+        solutions, not_loaded, PPs = retry(not_loaded, spaces, self.load_type, solutions, self.container_dimensions,
+                                           boxes, index, recorder)
+
+        if recorder is not None:
+            recorder.add_time('retry', start)
+            recorder.count('intersection_tests', index.tests)
+            for key, value in spaces.stats.items():
+                if key == 'peak':
+                    recorder.observe('pp_peak', value)
+                else:
+                    recorder.count(f'pp_{key}', value)
+            recorder.count('pp_final', len(PPs))
+
+        return solutions, not_loaded, PPs
+
+def load_boxes(boxes, container_dimensions, load_type, viaje, recorder=None, state=None, prefix=None):
+    # If a recorder is given the time of each phase, the feasibility checks and the PP statistics are added to it
+    # With load type 4 the boxes are loaded on top of a LoadedContainer (state), if it isn't given it is read from
+    # soluciones/output_{viaje}.json
+    # With a PrefixCache the packing starts from the state saved after the longest prefix of boxes (in the same
+    # order and orientation) loaded by a previous restart, and it saves the state where this restart diverges
+    items = list(boxes.items())
+    packer = None
+    depth = shared = 0
+
+    if prefix is not None:
+        keys = [(id, box[0]) for id, box in items]
+        packer, depth, shared = prefix.resume(keys)
+        if packer is not None:
+            packer.reset_stats()
+        if recorder is not None:
+            recorder.count('prefix_boxes', depth)
+
+    if packer is None:
+        packer = Packer(container_dimensions, load_type, viaje, state)
 
-        # If the box is not loaded we add it to the not_loaded dictionary
-        if solution is None: 
-            not_loaded[id] = box
-    
-    # Remove not validated boxes from solutions
-    for item in pending:
-        not_loaded[item[0]] = boxes[item[0]]
-        solutions.remove(item)
+    # Loop over each box and try to place it
+    for k in range(depth, len(items)):
+        if k == shared and k > depth:
+            prefix.save(packer)
 
-    solutions, not_loaded, PPs = retry(not_loaded, PPs, load_type, solutions, container_dimensions, boxes)
+        packer.place(*items[k], recorder)
 
-    return solutions, not_loaded, PPs
\ No newline at end of file
+    return packer.finish(boxes, recorder)
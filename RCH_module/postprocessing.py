@@ -1,44 +1,50 @@
+from collections import deque
+
 def separate_boxes(solution, hmap):
     # This function aims to separate the groups of boxes created in preprocessing into single boxes
+    # Each box is visited once: the single boxes of a group go to the final solution when the group is separated and
+    # the groups inside a group are separated after the boxes of the solution, so every box is added only once
     final_solution = []
+    groups = deque()
 
     # We check all of the solutions and if any of the solutions is contained in the hmap it means that the solution is a group of boxes
-    while solution:
-        i = solution.pop(0)
-        id = i[0]
-        sol = i[1]
-
-        suffix = id[0][-2:len(id[0])]
-        if id in hmap:
-            
-            # If the solution is in the hmap we iterate over local solution contained in the hmap of where each box is located
-            # relative to the other boxes in its group
-            for box, position in hmap[id]:
-                
-                # We have different cases of how the local solution gets added to the global solution, if the global solution
-                # has a negative width, it means it has been placed on the right wall so the width of individual boxes
-                # will also be negative. We also have the case where we only want to change the height of the box, these boxes have an added
-                # _H to the id to make them identifiable.
-                if suffix == '_H':
-                    new_position = (sol[0], sol[1], position[2], sol[3], sol[4], position[5])
-
-                elif sol[4] < 0:
-                    if position[1] > 0:
-                        new_position = (position[0]+sol[0], sol[1]-position[1], position[2]+sol[2], position[3], -position[4], position[5])
-                    else:
-                        new_position = (position[0]+sol[0], position[1]+sol[1], position[2]+sol[2], position[3], -position[4], position[5])
-
-                else:
-                    new_position = (position[0]+sol[0], position[1]+sol[1], position[2]+sol[2], position[3], position[4], position[5])
-                    
-                new_sol = (box, new_position)
-                
-                solution.append(new_sol)
-
-                if box not in hmap:
-                    final_solution.append(new_sol)
+    for i in solution:
+        if i[0] in hmap:
+            _separate(i, hmap, final_solution, groups)
         else:
             final_solution.append(i)
 
+    while groups:
+        _separate(groups.popleft(), hmap, final_solution, groups)
+
     return final_solution
-        
\ No newline at end of file
+
+def _separate(group, hmap, final_solution, groups):
+    id, sol = group
+    suffix = id[0][-2:]
+
+    # If the solution is in the hmap we iterate over local solution contained in the hmap of where each box is located
+    # relative to the other boxes in its group
+    for box, position in hmap[id]:
+
+        # We have different cases of how the local solution gets added to the global solution, if the global solution
+        # has a negative width, it means it has been placed on the right wall so the width of individual boxes
+        # will also be negative. We also have the case where we only want to change the height of the box, these boxes have an added
+        # _H to the id to make them identifiable.
+        if suffix == '_H':
+            new_position = (sol[0], sol[1], position[2], sol[3], sol[4], position[5])
+
+        elif sol[4] < 0:
+            if position[1] > 0:
+                new_position = (position[0]+sol[0], sol[1]-position[1], position[2]+sol[2], position[3], -position[4], position[5])
+            else:
+                new_position = (position[0]+sol[0], position[1]+sol[1], position[2]+sol[2], position[3], -position[4], position[5])
+
+        else:
+            new_position = (position[0]+sol[0], position[1]+sol[1], position[2]+sol[2], position[3], position[4], position[5])
+
+        # The groups inside a group are separated later, the single boxes are already final
+        if box in hmap:
+            groups.append((box, new_position))
+        else:
+            final_solution.append((box, new_position))
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+class PrefixCache:
+    """
+    Tree of the packing states saved after the prefixes of boxes that several restarts load in the same way.
+
+    Parameters:
+        max_snapshots (int): Maximum number of saved states, the least recently used ones are dropped above it.
+            With 0 nothing is saved.
+        max_nodes (int): Maximum number of nodes of the tree, it is emptied when it grows above it.
+        grow (int): Number of boxes of a restart added to the tree after the point where it leaves the tree.
+
+    Each node of the tree is a box (id and length, the length gives its orientation) loaded after the boxes of its
+    parent nodes. A restart follows the tree with its order of boxes, it starts packing from the deepest saved
+    state on the way and saves the state where it leaves the tree, as that prefix is now shared by two restarts.
+    The tree only grows by a few nodes per restart, the prefixes that are repeated the most get deeper. start has to
+    be called for each trip, every worker process gets its own copy of the cache.
+    """
+
+    def __init__(self, max_snapshots=256, max_nodes=100000, grow=4):
+        self.max_snapshots = max_snapshots
+        self.max_nodes = max_nodes
+        self.grow = grow
+        self.start()
+
+    def start(self):
+        # Each node is a list [children, saved packer]
+        self.root = [{}, None]
+        self.nodes = 0
+        self.snapshots = OrderedDict()
+        self.divergence = None
+        self.hits = 0
+        self.skipped = 0
+
+    def resume(self, keys):
+        """
+        Find where a restart can start packing.
+
+        Parameters:
+            keys (list): Tuples (id, length) of the boxes of the restart in the order they are loaded.
+
+        Returns:
+            tuple: (packer, depth, shared), a copy of the packer saved after the first depth boxes (None if there is
+            none) and the number of boxes that are already in the tree.
+        """
+        self.divergence = None
+        if self.max_snapshots <= 0:
+            return None, 0, 0
+
+        node = self.root
+        saved, depth, shared = None, 0, 0
+        for key in keys:
+            child = node[0].get(key)
+            if child is None:
+                break
+
+            node = child
+            shared += 1
+            if node[1] is not None:
+                saved, depth = node, shared
+
+        if saved is not None:
+            self.snapshots.move_to_end(id(saved))
+            self.hits += 1
+            self.skipped += depth
+
+        # The restart leaves the tree here, the next boxes become new nodes
+        self.divergence = node
+        for key in keys[shared:shared + self.grow]:
+            node[0][key] = [{}, None]
+            node = node[0][key]
+            self.nodes += 1
+
+        if self.nodes > self.max_nodes:
+            self.start()
+
+        return (saved[1].copy() if saved is not None else None), depth, shared
+
+    def save(self, packer):
+        # Save a copy of the packer at the node where the last restart passed to resume left the tree
+        node = self.divergence
+        if node is None or node[1] is not None:
+            return
+
+        node[1] = packer.copy()
+        self.snapshots[id(node)] = node
+        if len(self.snapshots) > self.max_snapshots:
+            oldest = self.snapshots.popitem(last=False)[1]
+            oldest[1] = None
+
@@ -1,15 +1,160 @@
 import random
-from itertools import combinations
+from bisect import bisect_right
+import heapq
+import numpy as np
 import pandas as pd
 
-def join_box(df, container_dimensions):
+# Tolerances in cm used to combine boxes
+LENGTH_TOLERANCE = 8
+HEIGHT_TOLERANCE = 15
+VOLUMETRIC_TOLERANCE = 25
+
+def _stack_case(box1, box2, container_height):
+    # Returns 1 if box2 can be stacked on top of box1, 2 if box1 can be stacked on top of box2 and 0 otherwise
+    if box1.Remontable == 1 and abs(box1.LargoCm - box2.LargoCm) < VOLUMETRIC_TOLERANCE and abs(box1.AnchoCm - box2.AnchoCm) < VOLUMETRIC_TOLERANCE and box1.AltoCm + box2.AltoCm < container_height:
+        return 1
+    elif box2.Remontable == 1 and abs(box1.LargoCm - box2.LargoCm) < VOLUMETRIC_TOLERANCE and abs(box1.AnchoCm) - abs(box2.AnchoCm) < VOLUMETRIC_TOLERANCE and box1.AltoCm + box2.AltoCm < container_height:
+        return 2
+
+    return 0
+
+def _width_case(box1, box2, container_width):
+    # Returns which sides of the 2 boxes fill the container width (1 to 4) or 0 if they don't
+    #   1. Width of box 1 + Width of box 2
+    #   2. Width of box 1 + Length of box 2
+    #   3. Length of box 1 + Width of box 2
+    #   4. Length of box 1 + Length of box 2
+    sides = [(box1.AnchoCm, box2.AnchoCm, box1.LargoCm, box2.LargoCm),
+             (box1.AnchoCm, box2.LargoCm, box1.LargoCm, box2.AnchoCm),
+             (box1.LargoCm, box2.AnchoCm, box1.AnchoCm, box2.LargoCm),
+             (box1.LargoCm, box2.LargoCm, box1.AnchoCm, box2.AnchoCm)]
+
+    for case, (width1, width2, length1, length2) in enumerate(sides, 1):
+        if 0 <= (container_width - (width1 + width2)) < LENGTH_TOLERANCE and abs(length1 - length2) < LENGTH_TOLERANCE and abs(box1.AltoCm - box2.AltoCm) < HEIGHT_TOLERANCE:
+            return case
+
+    return 0
+
+def _window(sorted_values, low, high):
+    # Indices of the boxes whose value is in the interval (low, high], sorted_values is a sorted list of (value, index)
+    start = bisect_right(sorted_values, (low, float('inf')))
+    end = bisect_right(sorted_values, (high, float('inf')))
+    return [i for value, i in sorted_values[start:end]]
+
+def _stack_pairs(boxes, container_height):
+    # Greedy pairing in the same order as combinations(boxes, 2), a box is combined with the first box after it that
+    # can go on top or below it. Only the boxes in the neighbouring length bands can be within the tolerance.
+    # Boxes without a length can't be within the tolerance of any other box
+    bands = {}
+    for i, box in enumerate(boxes):
+        if box.LargoCm == box.LargoCm:
+            bands.setdefault(int(box.LargoCm // VOLUMETRIC_TOLERANCE), []).append(i)
+
+    combined_boxes = set()
+    pairs = []
+    for i, box1 in enumerate(boxes):
+        if box1.Partida in combined_boxes or box1.LargoCm != box1.LargoCm:
+            continue
+
+        band = int(box1.LargoCm // VOLUMETRIC_TOLERANCE)
+        candidates = heapq.merge(*[bands.get(b, [])[bisect_right(bands.get(b, []), i):] for b in (band - 1, band, band + 1)])
+
+        for j in candidates:
+            box2 = boxes[j]
+            if box2.Partida in combined_boxes:
+                continue
+
+            case = _stack_case(box1, box2, container_height)
+            if case:
+                pairs.append((box1, box2, case))
+                combined_boxes.add(box1.Partida)
+                combined_boxes.add(box2.Partida)
+                break
+
+    return pairs, combined_boxes
+
+def _width_pairs(boxes, container_width):
+    # Greedy pairing in the same order as combinations(boxes, 2) of 2 boxes that together fill the container width.
+    # The partner has to have a width or length in the window left by the width or length of the first box.
+    by_width = sorted((box.AnchoCm, i) for i, box in enumerate(boxes))
+    by_length = sorted((box.LargoCm, i) for i, box in enumerate(boxes))
+
+    combined_boxes = set()
+    pairs = []
+    for i, box1 in enumerate(boxes):
+        if box1.Partida in combined_boxes:
+            continue
+
+        candidates = set()
+        for side in (box1.AnchoCm, box1.LargoCm):
+            for sorted_values in (by_width, by_length):
+                candidates.update(_window(sorted_values, container_width - side - LENGTH_TOLERANCE, container_width - side))
+
+        for j in sorted(x for x in candidates if x > i):
+            box2 = boxes[j]
+            if box2.Partida in combined_boxes:
+                continue
+
+            case = _width_case(box1, box2, container_width)
+            if case:
+                pairs.append((box1, box2, case))
+                combined_boxes.add(box1.Partida)
+                combined_boxes.add(box2.Partida)
+                break
+
+    return pairs, combined_boxes
+
+def _width_triples(boxes, container_width, hmap):
+    # Greedy grouping in the same order as combinations(group, 3) of 3 boxes with the same length whose widths fill the
+    # container width. For each pair we look for the third box in the window of widths left.
+    length_groups = {}
+    for box in boxes:
+        # Boxes that are already a combination are not combined again
+        if (box.Partida, box.Expedicion) in hmap:
+            continue
+        length_groups.setdefault(box.LargoCm, []).append(box)
+
+    combined_boxes = set()
+    triples = []
+    for length, group in sorted(length_groups.items(), key=lambda x: x[0]):
+        by_width = sorted((box.AnchoCm, k) for k, box in enumerate(group))
+
+        for i, box1 in enumerate(group):
+            for j in range(i + 1, len(group)):
+                box2 = group[j]
+                if box1.Partida in combined_boxes:
+                    break
+                if box2.Partida in combined_boxes or abs(box1.AltoCm - box2.AltoCm) > HEIGHT_TOLERANCE:
+                    continue
+
+                # The third box has to leave a gap between 0 and the tolerance
+                gap = container_width - box1.AnchoCm - box2.AnchoCm
+                candidates = [k for k in _window(by_width, gap - LENGTH_TOLERANCE, gap) if k > j]
+                candidates = [k for k in sorted(candidates) if 0 < gap - group[k].AnchoCm < LENGTH_TOLERANCE]
+
+                for k in candidates:
+                    box3 = group[k]
+                    if box3.Partida in combined_boxes:
+                        continue
+                    if abs(box1.AltoCm - box3.AltoCm) > HEIGHT_TOLERANCE or abs(box2.AltoCm - box3.AltoCm) > HEIGHT_TOLERANCE:
+                        continue
+
+                    triples.append((box1, box2, box3))
+                    combined_boxes.add(box1.Partida)
+                    combined_boxes.add(box2.Partida)
+                    combined_boxes.add(box3.Partida)
+                    break
+
+    return triples, combined_boxes
+
+def join_box(df, container_dimensions, width_combinations=True):
 
     container_length, container_width, container_height = container_dimensions
 
     # Define tolerance in cm
-    length_tolerance = 8
-    height_tolerance = 15
-    volumetric_tolerance = 25
+    length_tolerance = LENGTH_TOLERANCE
+    height_tolerance = HEIGHT_TOLERANCE
+    volumetric_tolerance = VOLUMETRIC_TOLERANCE
 
     # Boxes within the tolerance are set to the standard value for a pallet
     df.loc[
@@ -20,64 +165,33 @@ def join_box(df, container_dimensions):
     
     hmap= {}
     new_boxes = []
-    combined_boxes = set()
 
     # Boxes that are not stackable and weigh more than 200 kg can be considered to occupy the entire height of the container
-    for box1, box2 in combinations(df.itertuples(index=False), 2):
-
-        # If any of the 2 boxes have already been combined we skip
-        if box1.Partida in combined_boxes or box2.Partida in combined_boxes:
-            continue 
-
-        if box1.Remontable == 1 and abs(box1.LargoCm - box2.LargoCm) < volumetric_tolerance and abs(box1.AnchoCm - box2.AnchoCm) < volumetric_tolerance and box1.AltoCm + box2.AltoCm < container_height:
-            new_box = {
-                'CodigoViaje': box1.CodigoViaje,
-                'FechaCargaContenedor': box1.FechaCargaContenedor,
-                'FechaEntradaAlmacen': box1.FechaEntradaAlmacen,
-                'Expedicion': box1.Expedicion,
-                'Partida': box1.Partida + '/' + box2.Partida + '_H',
-                'PesoKg': box1.PesoKg,
-                'LargoCm': max(box1.LargoCm, box2.LargoCm),
-                'AltoCm': box1.AltoCm + box2.AltoCm,
-                'AnchoCm': max(box1.AnchoCm, box2.AnchoCm),
-                'TipoPartida': box1.TipoPartida,
-                'Remontable': box2.Remontable,
-                'Volumen': box1.Volumen + box2.Volumen
-                }
-            
-            # We add the _H suffix so we can then know to only change the height for visualization
-            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
-                          ((box2.Partida, box2.Expedicion), (0, 0, box1.AltoCm, box2.LargoCm, box2.AnchoCm, box2.AltoCm))]
-            hmap[(box1.Partida + '/' + box2.Partida + '_H', box1.Expedicion)] = hmap_entry
+    # The pairs are searched by length bands, in case 1 box2 goes on top of box1 and in case 2 the other way round
+    pairs, combined_boxes = _stack_pairs(list(df.itertuples(index=False)), container_height)
+    for box1, box2, case in pairs:
+        bottom, top = (box1, box2) if case == 1 else (box2, box1)
+        new_box = {
+            'CodigoViaje': bottom.CodigoViaje,
+            'FechaCargaContenedor': bottom.FechaCargaContenedor,
+            'FechaEntradaAlmacen': bottom.FechaEntradaAlmacen,
+            'Expedicion': bottom.Expedicion,
+            'Partida': bottom.Partida + '/' + top.Partida + '_H',
+            'PesoKg': box1.PesoKg,
+            'LargoCm': max(box1.LargoCm, box2.LargoCm),
+            'AltoCm': box1.AltoCm + box2.AltoCm,
+            'AnchoCm': max(box1.AnchoCm, box2.AnchoCm),
+            'TipoPartida': box1.TipoPartida,
+            'Remontable': top.Remontable,
+            'Volumen': box1.Volumen + box2.Volumen
+            }
 
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
-            new_boxes.append(new_box)
+        # We add the _H suffix so we can then know to only change the height for visualization
+        hmap_entry = [((bottom.Partida, bottom.Expedicion), (0, 0, 0, bottom.LargoCm, bottom.AnchoCm, bottom.AltoCm)),
+                      ((top.Partida, top.Expedicion), (0, 0, bottom.AltoCm, top.LargoCm, top.AnchoCm, top.AltoCm))]
+        hmap[(bottom.Partida + '/' + top.Partida + '_H', bottom.Expedicion)] = hmap_entry
 
-        elif box2.Remontable == 1 and abs(box1.LargoCm - box2.LargoCm) < volumetric_tolerance and abs(box1.AnchoCm) - abs(box2.AnchoCm) < volumetric_tolerance and box1.AltoCm + box2.AltoCm < container_height:
-            new_box = {
-                'CodigoViaje': box2.CodigoViaje,
-                'FechaCargaContenedor': box2.FechaCargaContenedor,
-                'FechaEntradaAlmacen': box2.FechaEntradaAlmacen,
-                'Expedicion': box2.Expedicion,
-                'Partida': box2.Partida + '/' + box1.Partida + '_H',
-                'PesoKg': box1.PesoKg,
-                'LargoCm': max(box1.LargoCm, box2.LargoCm),
-                'AltoCm': box1.AltoCm + box2.AltoCm,
-                'AnchoCm': max(box1.AnchoCm, box2.AnchoCm),
-                'TipoPartida': box1.TipoPartida,
-                'Remontable': box1.Remontable,
-                'Volumen': box1.Volumen + box2.Volumen
-                }
-            
-            # We add the _H suffix so we can then know to only change the height for visualization
-            hmap_entry = [((box2.Partida, box2.Expedicion), (0, 0, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm)),
-                          ((box1.Partida, box1.Expedicion), (0, 0, box2.AltoCm, box1.LargoCm, box1.AnchoCm, box1.AltoCm))]
-            hmap[(box2.Partida + '/' + box1.Partida + '_H', box2.Expedicion)] = hmap_entry
-
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
-            new_boxes.append(new_box)
+        new_boxes.append(new_box)
 
     df = df[~df['Partida'].isin(combined_boxes)]
 
@@ -85,18 +199,12 @@ def join_box(df, container_dimensions):
     new_boxes_df = pd.DataFrame(new_boxes)
     df = pd.concat([df, new_boxes_df])
 
-    new_boxes = []
-    combined_boxes = set()
-    """
-    # Iterate over all possible combinations of 2 boxes
-    for box1, box2 in combinations(df.itertuples(index=False), 2):
-
-        # If any of the 2 boxes have already been combined we skip
-        if box1.Partida in combined_boxes or box2.Partida in combined_boxes:
-            continue  
-        
-        # Case1: Width of box 1 + Width of box 2 is close to container width.
-        if 0 <= (container_width - (box1.AnchoCm + box2.AnchoCm)) < length_tolerance and abs(box1.LargoCm - box2.LargoCm) < length_tolerance and abs(box1.AltoCm - box2.AltoCm) < height_tolerance:
+    if width_combinations:
+        new_boxes = []
+
+        # Combinations of 2 boxes whose widths or lengths fill the container width
+        pairs, combined_boxes = _width_pairs(list(df.itertuples(index=False)), container_width)
+        for box1, box2, case in pairs:
             new_box = {
                 'CodigoViaje': box1.CodigoViaje,
                 'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor),
@@ -104,186 +212,129 @@ def join_box(df, container_dimensions):
                 'Expedicion': box1.Expedicion,
                 'Partida': box1.Partida + '/' + box2.Partida + '_W',
                 'PesoKg': box1.PesoKg + box2.PesoKg,
-                'LargoCm': box1.AnchoCm + box2.AnchoCm,
                 'AltoCm': max(box1.AltoCm, box2.AltoCm),
-                'AnchoCm': max(box1.LargoCm, box2.LargoCm),
                 'TipoPartida': box1.TipoPartida,
                 'Remontable': min(box1.Remontable, box2.Remontable),
                 'Volumen': box1.Volumen + box2.Volumen
             }
 
             # Create the hash map entry which has the same structure as the solutions to ease visualization
-            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
-                          ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm))]
-            hmap[(box1.Partida + '/' + box2.Partida + '_W', box1.Expedicion)] = hmap_entry
-            
-            # Add new combined boxe to the new_boxes
-            new_boxes.append(new_box)
-            
-            # Add both combined boxes to the combined_boxes set so we don't combine them again
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
+            if case == 1:
+                new_box['LargoCm'] = box1.AnchoCm + box2.AnchoCm
+                new_box['AnchoCm'] = max(box1.LargoCm, box2.LargoCm)
+                hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
+                              ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm))]
+            elif case == 2:
+                new_box['LargoCm'] = box1.AnchoCm + box2.LargoCm
+                new_box['AnchoCm'] = max(box1.LargoCm, box2.AnchoCm)
+                hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
+                              ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.AnchoCm, box2.LargoCm, box2.AltoCm))]
+            elif case == 3:
+                new_box['LargoCm'] = box1.LargoCm + box2.AnchoCm
+                new_box['AnchoCm'] = max(box1.AnchoCm, box2.LargoCm)
+                hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.AnchoCm, box1.LargoCm, box1.AltoCm)),
+                              ((box2.Partida, box2.Expedicion), (0, box1.LargoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm))]
+            else:
+                new_box['LargoCm'] = box1.LargoCm + box2.LargoCm
+                new_box['AnchoCm'] = max(box1.AnchoCm, box2.AnchoCm)
+                hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.AnchoCm, box1.LargoCm, box1.AltoCm)),
+                              ((box2.Partida, box2.Expedicion), (0, box1.LargoCm, 0, box2.AnchoCm, box2.LargoCm, box2.AltoCm))]
 
-        # Case 2: Width of box 1 + Length of box 2 is close to container width
-        if 0 <= (container_width - (box1.AnchoCm + box2.LargoCm)) < length_tolerance and abs(box1.LargoCm - box2.AnchoCm) < length_tolerance and abs(box1.AltoCm - box2.AltoCm) < height_tolerance:
-            new_box = {
-                'CodigoViaje': box1.CodigoViaje,
-                'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor),
-                'FechaEntradaAlmacen': max(box1.FechaEntradaAlmacen, box2.FechaEntradaAlmacen),
-                'Expedicion': box1.Expedicion,
-                'Partida': box1.Partida + '/' + box2.Partida + '_W',
-                'PesoKg': box1.PesoKg + box2.PesoKg,
-                'LargoCm': box1.AnchoCm + box2.LargoCm,
-                'AltoCm': max(box1.AltoCm, box2.AltoCm),
-                'AnchoCm': max(box1.LargoCm, box2.AnchoCm),
-                'TipoPartida': box1.TipoPartida,
-                'Remontable': min(box1.Remontable, box2.Remontable),
-                'Volumen': box1.Volumen + box2.Volumen
-            }
-            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
-                          ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.AnchoCm, box2.LargoCm, box2.AltoCm))]
             hmap[(box1.Partida + '/' + box2.Partida + '_W', box1.Expedicion)] = hmap_entry
-            
             new_boxes.append(new_box)
 
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
+        # Filter df to exclude instances where the 'Partida' value is in the combined_boxes set
+        # we do this to make sure we don't have both the combined boxes and the singular box on its own
+        df = df[~df['Partida'].isin(combined_boxes)]
 
-        # Case 3: Length of box 1 + Width of box 2 is close to container width
-        if 0 <= (container_width - (box1.LargoCm + box2.AnchoCm)) < length_tolerance and abs(box1.AnchoCm - box2.LargoCm) < length_tolerance and abs(box1.AltoCm - box2.AltoCm) < height_tolerance:
-            new_box = {
-                'CodigoViaje': box1.CodigoViaje,
-                'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor),
-                'FechaEntradaAlmacen': max(box1.FechaEntradaAlmacen, box2.FechaEntradaAlmacen),
-                'Expedicion': box1.Expedicion,
-                'Partida': box1.Partida + '/' + box2.Partida + '_W',
-                'PesoKg': box1.PesoKg + box2.PesoKg,
-                'LargoCm': box1.LargoCm + box2.AnchoCm,
-                'AltoCm': max(box1.AltoCm, box2.AltoCm),
-                'AnchoCm': max(box1.AnchoCm, box2.LargoCm),
-                'TipoPartida': box1.TipoPartida,
-                'Remontable': min(box1.Remontable, box2.Remontable),
-                'Volumen': box1.Volumen + box2.Volumen
-            }
-            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.AnchoCm, box1.LargoCm, box1.AltoCm)),
-                          ((box2.Partida, box2.Expedicion), (0, box1.LargoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm))]
-            hmap[(box1.Partida + '/' + box2.Partida + '_W', box1.Expedicion)] = hmap_entry
-            
-            new_boxes.append(new_box)
+        # Add the newly created boxes to the main dataframe
+        new_boxes_df = pd.DataFrame(new_boxes)
+        df = pd.concat([df, new_boxes_df])
 
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
-
-        # Case 3: Length of box 1 + Length of box 2 is close to container width
-        if 0 <= (container_width - (box1.LargoCm + box2.LargoCm)) < length_tolerance and abs(box1.AnchoCm - box2.AnchoCm) < length_tolerance and abs(box1.AltoCm - box2.AltoCm) < height_tolerance:
+        # Combining 3 boxes with the same length whose widths fill the container width
+        new_boxes = []
+        triples, combined_boxes = _width_triples(list(df.itertuples(index=False)), container_width, hmap)
+        for box1, box2, box3 in triples:
             new_box = {
                 'CodigoViaje': box1.CodigoViaje,
-                'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor),
-                'FechaEntradaAlmacen': max(box1.FechaEntradaAlmacen, box2.FechaEntradaAlmacen),
+                'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor, box3.FechaCargaContenedor),
+                'FechaEntradaAlmacen': max(box1.FechaEntradaAlmacen, box2.FechaEntradaAlmacen, box3.FechaEntradaAlmacen),
                 'Expedicion': box1.Expedicion,
-                'Partida': box1.Partida + '/' + box2.Partida + '_W',
-                'PesoKg': box1.PesoKg + box2.PesoKg,
-                'LargoCm': box1.LargoCm + box2.LargoCm,
-                'AltoCm': max(box1.AltoCm, box2.AltoCm),
-                'AnchoCm': max(box1.AnchoCm, box2.AnchoCm),
+                'Partida': box1.Partida + '/' + box2.Partida + '/' + box3.Partida + '_W',
+                'PesoKg': box1.PesoKg + box2.PesoKg + box3.PesoKg,
+                'LargoCm': max(box1.LargoCm, box2.LargoCm, box3.LargoCm),
+                'AltoCm': max(box1.AltoCm, box2.AltoCm, box3.AltoCm),
+                'AnchoCm': box1.AnchoCm + box2.AnchoCm + box3.AnchoCm,
                 'TipoPartida': box1.TipoPartida,
-                'Remontable': min(box1.Remontable, box2.Remontable),
-                'Volumen': box1.Volumen + box2.Volumen
+                'Remontable': min(box1.Remontable, box2.Remontable, box3.Remontable),
+                'Volumen': box1.Volumen + box2.Volumen + box3.Volumen
             }
-            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.AnchoCm, box1.LargoCm, box1.AltoCm)),
-                          ((box2.Partida, box2.Expedicion), (0, box1.LargoCm, 0, box2.AnchoCm, box2.LargoCm, box2.AltoCm))]
-            hmap[(box1.Partida + '/' + box2.Partida + '_W', box1.Expedicion)] = hmap_entry
-            
-            new_boxes.append(new_box)
-
-
-            combined_boxes.add(box1.Partida)
-            combined_boxes.add(box2.Partida)
-
-    # Filter df to exclude instances where the 'Partida' value is in the combined_boxes set
-    # we do this to make sure we don't have both the combined boxes and the singular box on its own
-    df = df[~df['Partida'].isin(combined_boxes)]
 
-    # Add the newly created boxes to the main dataframe
-    new_boxes_df = pd.DataFrame(new_boxes)
-    df = pd.concat([df, new_boxes_df])
-
-    # Combining 3 boxes
-    # We create a dictionary which for each value of length found it has all the boxes with that length
-    length_groups = {}
-    for box in df.itertuples():
-        length = box.LargoCm
-        if length not in length_groups:
-            length_groups[length] = []
-        
-        length_groups[length].append(box)
-
-    # Sort the groups by length
-    length_groups = sorted(length_groups.items(), key=lambda x: x[0])
-    length_groups = dict(length_groups)
-
-    valid_combinations = []
-    combined_boxes = set()
-    new_boxes = []
-
-    # For each length group we generate all the possible combinations of 3 boxes
-    for length, group in length_groups.items():
-        for combo in combinations(group, 3):
-            box1, box2, box3 = combo
-
-            # If any of the boxes are already combined we skip this combination
-            if box1.Partida in combined_boxes or box2.Partida in combined_boxes or box3.Partida in combined_boxes:
-                continue
-            if (box1.Partida, box1.Expedicion) in hmap or (box2.Partida, box2.Expedicion) in hmap or (box3.Partida, box3.Expedicion) in hmap:
-                continue
-
-            total_width = sum(box.AnchoCm for box in combo)
+            # Generate hashmap entry
+            hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
+                          ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm)),
+                          ((box3.Partida, box3.Expedicion), (0, box1.AnchoCm+box2.AnchoCm, 0, box3.LargoCm, box3.AnchoCm, box3.AltoCm))]
+            hmap[(box1.Partida + '/' + box2.Partida + '/' + box3.Partida + '_W', box1.Expedicion)] = hmap_entry
 
-            # Check if the heights are within the tolerance range
-            if abs(box1.AltoCm - box2.AltoCm) > height_tolerance:
-                continue
-            elif abs(box1.AltoCm - box3.AltoCm) > height_tolerance:
-                continue
-            elif abs(box2.AltoCm - box3.AltoCm) > height_tolerance:
-                continue
-            
-            # Check if the total width (sum of all widths) is within the tolerance range
-            if 0 < (container_width - total_width) < length_tolerance:
-                
-                new_box = {
-                    'CodigoViaje': box1.CodigoViaje,
-                    'FechaCargaContenedor': max(box1.FechaCargaContenedor, box2.FechaCargaContenedor, box3.FechaCargaContenedor),
-                    'FechaEntradaAlmacen': max(box1.FechaEntradaAlmacen, box2.FechaEntradaAlmacen, box3.FechaEntradaAlmacen),
-                    'Expedicion': box1.Expedicion,
-                    'Partida': box1.Partida + '/' + box2.Partida + '/' + box3.Partida + '_W',
-                    'PesoKg': box1.PesoKg + box2.PesoKg + box3.PesoKg,
-                    'LargoCm': max(box1.LargoCm, box2.LargoCm, box3.LargoCm),
-                    'AltoCm': max(box1.AltoCm, box2.AltoCm, box3.AltoCm),
-                    'AnchoCm': box1.AnchoCm + box2.AnchoCm + box3.AnchoCm,
-                    'TipoPartida': box1.TipoPartida,
-                    'Remontable': min(box1.Remontable, box2.Remontable, box3.Remontable),
-                    'Volumen': box1.Volumen + box2.Volumen + box3.Volumen
-                }
-                
-                # Generate hashmap entry 
-                hmap_entry = [((box1.Partida, box1.Expedicion), (0, 0, 0, box1.LargoCm, box1.AnchoCm, box1.AltoCm)),
-                              ((box2.Partida, box2.Expedicion), (0, box1.AnchoCm, 0, box2.LargoCm, box2.AnchoCm, box2.AltoCm)),
-                              ((box3.Partida, box3.Expedicion), (0, box1.AnchoCm+box2.AnchoCm, 0, box3.LargoCm, box3.AnchoCm, box3.AltoCm))]
-                hmap[(box1.Partida + '/' + box2.Partida + '/' + box3.Partida + '_W', box1.Expedicion)] = hmap_entry
+            new_boxes.append(new_box)
 
-                valid_combinations.append(combo)
-                new_boxes.append(new_box)
-                
-                combined_boxes.add(box1.Partida)
-                combined_boxes.add(box2.Partida)
-                combined_boxes.add(box3.Partida)
+        df = df[~df['Partida'].isin(combined_boxes)]
 
-    df = df[~df['Partida'].isin(combined_boxes)]
+        new_boxes_df = pd.DataFrame(new_boxes)
+        df = pd.concat([df, new_boxes_df])
 
-    new_boxes_df = pd.DataFrame(new_boxes)
-    df = pd.concat([df, new_boxes_df])
-    """
     # Reset the index to make sure there are no repeated indices in the dataframe
     df = df.reset_index(drop=True)
     
-    return df, hmap
\ No newline at end of file
+    return df, hmap
+
+class BoxTable:
+    """
+    Boxes of a trip compiled into arrays once after join_box, so the restarts don't have to read the DataFrame.
+
+    Attributes:
+        ids (list): Tuples (Partida, Expedicion) in the same order as the DataFrame rows.
+        length, width, height (np.ndarray): LargoCm, AnchoCm and AltoCm of each box.
+        remontable (np.ndarray): 1 if the box is stackable.
+        volume (np.ndarray): Volume of each box, it doesn't depend on the orientation.
+        fixed (np.ndarray): 0 if the orientation is random, 1 if the box keeps (length, width) and 2 if it is
+            rotated to (width, length) because one of the sides fills the container width.
+        height_key (np.ndarray): Height scaled so that height_key + length sorts by height and then length.
+    """
+
+    def __init__(self, df, container_dimensions):
+        container_length, container_width, container_height = container_dimensions
+
+        self.ids = list(zip(df['Partida'], df['Expedicion']))
+        self.length = df['LargoCm'].to_numpy().astype(np.int64)
+        self.width = df['AnchoCm'].to_numpy().astype(np.int64)
+        self.height = df['AltoCm'].to_numpy().astype(np.int64)
+        self.remontable = df['Remontable'].to_numpy().astype(np.int64)
+        self.volume = self.length * self.width * self.height
+
+        # If we can fill the width of the container in one of the given directions we choose it, the second
+        # direction wins if both of them fill the width
+        fill_length = (self.length > container_width) | ((0 <= container_width - self.width) & (container_width - self.width < 8))
+        fill_width = (self.width > container_width) | ((0 <= container_width - self.length) & (container_width - self.length < 8))
+        self.fixed = np.where(fill_width, 2, np.where(fill_length, 1, 0))
+
+        # Heights don't change with the orientation, we scale them once so a single key sorts by (height, length)
+        scale = int(max(self.length.max(initial=0), self.width.max(initial=0))) + 1
+        self.height_key = self.height * scale
+
+    def __len__(self):
+        return len(self.ids)
+
+    def boxes(self, order, length, width, priority):
+        # Build the boxes dictionary used by load_boxes in the given order
+        length = length[order].tolist()
+        width = width[order].tolist()
+        height = self.height[order].tolist()
+        priority = priority[order].tolist()
+        remontable = self.remontable[order].tolist()
+
+        return {self.ids[i]: [length[k], width[k], height[k], priority[k], remontable[k]] for k, i in enumerate(order.tolist())}
+
+def compile_boxes(df, container_dimensions):
+    # One-time compilation of the preprocessed trip, it is shared by all the restarts
+    return BoxTable(df, container_dimensions)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+# Vertices of a box relative to (x, y, z) as multiples of (length, width, height) and the 12 triangles of its faces
+CORNERS = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
+TRIANGLES = np.array([[7, 3, 0], [0, 4, 7], [0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7],
+                      [6, 5, 1], [1, 2, 6], [4, 0, 5], [0, 1, 5], [3, 6, 7], [6, 3, 2]])
+
+def solution_figure(solution, title=None, colors=qualitative.Plotly):
+    """
+    Build the figure of a solution with all of its boxes in a single mesh.
+
+    Parameters:
+        solution (list): Solution as returned by RCH, a list of (id, (x, y, z, length, width, height)).
+        title (str): Title of the figure.
+        colors (list): Colors given to the boxes in turn.
+
+    Returns:
+        go.Figure: Figure with one Mesh3d trace, each box has its own color and hover text.
+    """
+    n = len(solution)
+    boxes = np.array([box[0:6] for id, box in solution]).reshape(n, 6)
+
+    # The widths of the boxes placed on the right wall are negative, their vertices go from y to y + width anyway
+    vertices = boxes[:, None, 0:3] + CORNERS[None, :, :] * boxes[:, None, 3:6]
+    vertices = vertices.reshape(-1, 3)
+    faces = (TRIANGLES[None, :, :] + 8 * np.arange(n)[:, None, None]).reshape(-1, 3)
+
+    hover_text = [f'{id}<br>Dimensions: {box[3]}x{box[4]}x{box[5]}<br>Position: ({box[0]}, {box[1]}, {box[2]})'
+                  for id, box in solution]
+
+    fig = go.Figure(go.Mesh3d(
+        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+        i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
+        facecolor=[colors[b % len(colors)] for b in range(n) for _ in range(len(TRIANGLES))],
+        hovertext=[text for text in hover_text for _ in range(len(CORNERS))],
+        hoverinfo='text',
+        flatshading=True
+        ))
+
+    fig.update_layout(
+        title=title,
+        scene=dict(
+            xaxis_title='X',
+            yaxis_title='Y',
+            zaxis_title='Z',
+            aspectmode='data')
+        )
+
+    return fig
+
+def show_boxes(solution, renderer='browser'):
+    # Show the interactive plot
+    solution_figure(solution).show(renderer=renderer)
+
+def export_solution(solution, path, title=None):
+    # Save the figure as a static html file, or as plotly json if the path ends in .json
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig = solution_figure(solution, title)
+
+    if path.endswith('.json'):
+        fig.write_json(path)
+    else:
+        fig.write_html(path, include_plotlyjs='cdn')
+
+    return path
@@ -0,0 +1,490 @@
+import argparse
+import itertools
+import json
+import os
+import select
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Manager
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from .RCH import preprocess_trip, search, regenerate
+from .archive import SolutionArchive
+from .cache import TripCache
+from .container import MAXI_45, EQUIPMENT, ContainerSpec
+from .ingest import TripStore
+from .loaded import LoadedContainer, state_path
+from .local_search import Candidate
+from .stopping import StoppingPolicy
+
+# Trip store and cache of each worker process, set once by the pool initializer
+_worker = {}
+
+def _init_worker(store_dir, cache_dir):
+    # The modules are imported when the worker starts, the requests only pay for the preprocessing and the restarts
+    _worker['store'] = TripStore(store_dir) if store_dir is not None else None
+    _worker['cache'] = TripCache(cache_dir) if cache_dir is not None else None
+
+def _warm():
+    return os.getpid()
+
+class ServiceStopping(StoppingPolicy):
+    """
+    Stopping policy of a request of the service, it also stops the restarts when the request is cancelled.
+
+    Parameters:
+        job (int): Id of the request.
+        cancelled (dict): Shared dictionary with the ids of the cancelled requests.
+        events (Queue): Shared queue where the improvements of the best scores are sent.
+        poll (float): Seconds between two checks of cancelled, each check goes to the manager process.
+        The rest of parameters are the ones of StoppingPolicy.
+    """
+
+    def __init__(self, job, cancelled, events, poll=0.1, **kwargs):
+        self.job = job
+        self.cancelled = cancelled
+        self.events = events
+        self.poll = poll
+        super().__init__(**kwargs)
+
+    def start(self, load_type, reserve=0.0):
+        super().start(load_type, reserve)
+        self.last_poll = self.start_time
+
+    def update(self, scores, duplicate=False):
+        stop = super().update(scores, duplicate)
+        if self.since_improvement == 0 and self.events is not None:
+            self.events.put((self.job, {'event': 'improved', 'restarts': self.restarts, 'scores': list(scores)}))
+
+        now = time.perf_counter()
+        if not stop and self.cancelled is not None and now - self.last_poll >= self.poll:
+            self.last_poll = now
+            if self.job in self.cancelled:
+                self.stop_reason = 'cancelled'
+                stop = True
+
+        return stop
+
+def _container(request):
+    # Container of a request, the TipoEquipo of a known equipment or its [length, width, height], MAXI 45' by default
+    container = request.get('container')
+    if container is None:
+        return MAXI_45
+    if isinstance(container, str):
+        return EQUIPMENT[container]
+
+    return ContainerSpec(*container)
+
+def _jsonable(x):
+    # numpy scalars and arrays of the solutions, and the Candidates of the local search by their key
+    if isinstance(x, Candidate):
+        return x.key
+    if hasattr(x, 'tolist'):
+        return x.tolist()
+
+    raise TypeError(f'{type(x).__name__} is not JSON serializable')
+
+def solve(job, request, cancelled=None, events=None):
+    """
+    Solve a request in a worker process of the pool.
+
+    Parameters:
+        job (int): Id of the request.
+        request (dict): viaje, and the partidas of the trip as a list of rows (rows) or read from the store of the
+            service. load_type (1 by default), deadline (time.time() when the answer is due), max_restarts, container
+            and, for load type 4, state ({'solution', 'PPs'} of a previous answer, soluciones/output_{viaje}.json
+            by default).
+        cancelled (dict): Shared dictionary with the ids of the cancelled requests.
+        events (Queue): Shared queue for the progress of the request.
+
+    Returns:
+        dict: Best solution for the objective of the load type with its scores, seed, not loaded boxes and free PPs,
+        the number of restarts and why they stopped, and the non-dominated front of the restarts.
+    """
+    if events is not None:
+        events.put((job, {'event': 'started', 'pid': os.getpid()}))
+
+    viaje = request.get('viaje')
+    load_type = request.get('load_type', 1)
+    container_dimensions = _container(request)
+
+    if request.get('rows') is not None:
+        df = pd.DataFrame(request['rows'])
+    elif _worker.get('store') is not None:
+        df = _worker['store'].trip(viaje)
+    else:
+        raise ValueError('The request has no rows and the service has no trip store')
+
+    df, hmap, table = preprocess_trip(df, container_dimensions, _worker.get('cache'))
+
+    state = None
+    if load_type == 4:
+        if request.get('state') is not None:
+            state = LoadedContainer(request['state']['solution'], request['state']['PPs'])
+        else:
+            state = LoadedContainer.from_json(state_path(viaje))
+
+    # The time spent in the queue and in the preprocessing is part of the latency budget, the restarts get the rest
+    # and at least one restart is always run
+    time_budget = None
+    if request.get('deadline') is not None:
+        time_budget = max(0.0, request['deadline'] - time.time())
+
+    stopping = ServiceStopping(job, cancelled, events, max_restarts=request.get('max_restarts', 15000),
+                               time_budget=time_budget)
+    archive = search(container_dimensions, table, hmap, load_type, viaje, stopping=stopping,
+                     archive=SolutionArchive(), state=state)
+
+    scores, seed = archive.best(load_type)[0]
+    result = regenerate(container_dimensions, table, hmap, load_type, viaje, seed, state)
+
+    return json.loads(json.dumps({
+        'viaje': viaje,
+        'load_type': load_type,
+        'scores': list(scores),
+        'seed': seed,
+        'solution': result[3],
+        'not_loaded': [{'id': id, 'box': box} for id, box in result[4].items()],
+        'PPs': result[5],
+        'restarts': stopping.restarts,
+        'duplicates': stopping.duplicates,
+        'stop_reason': stopping.stop_reason,
+        'pareto': [{'scores': list(x), 'seed': seed} for x, seed in archive.pareto()],
+    }, default=_jsonable))
+
+class Job:
+    """
+    Request of the service, its progress events and its answer.
+
+    Parameters:
+        id (int): Id of the request.
+        request (dict): Request as received, see solve.
+    """
+
+    def __init__(self, id, request):
+        self.id = id
+        self.request = request
+        self.future = None
+        self.status = 'queued'
+        self.events = []
+        self.result = None
+        self.changed = threading.Condition()
+
+    def add(self, event, status=None):
+        with self.changed:
+            if status is not None:
+                self.status = status
+            self.events.append(event)
+            self.changed.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def follow(self, timeout=None):
+        # Events of the request as they happen, it ends after the last one (done, cancelled or failed)
+        # If there is no new event after timeout seconds it gives None, so the caller can check its client
+        i = 0
+        while True:
+            with self.changed:
+                if i == len(self.events) and not self.finished:
+                    self.changed.wait(timeout)
+                events = self.events[i:]
+                finished = self.finished
+            i += len(events)
+            yield from events or [None]
+
+            if finished and i == len(self.events):
+                return
+
+    def summary(self):
+        return {'job': self.id, 'status': self.status, 'viaje': self.request.get('viaje'),
+                'load_type': self.request.get('load_type', 1), 'result': self.result}
+
+class SolveService:
+    """
+    Warm pool of worker processes that solve the requests of the warehouse terminals.
+
+    Parameters:
+        n_workers (int): Number of worker processes, each one solves one request at a time.
+        store_dir (str): Folder of a TripStore, the requests can then give only the trip code.
+        cache_dir (str): Folder of the TripCache shared by the workers, None to not use it.
+        max_queue (int): Maximum number of requests waiting for a worker, the next ones are rejected.
+        budget (float): Latency budget in seconds of the requests that don't give one.
+        keep (int): Number of finished requests kept to be asked for later.
+
+    The workers are started and import the modules once, when the service starts. The requests wait in a queue of
+    the service and one is sent to the pool each time a worker is free, the restarts stop when its latency budget
+    (counted from its arrival) is used, so a terminal gets an answer in about that time. A request can be cancelled,
+    if it is still in the queue it is never run and if it is running its restarts stop and it answers with the best
+    solution so far.
+    """
+
+    def __init__(self, n_workers=2, store_dir=None, cache_dir=None, max_queue=32, budget=10.0, keep=1000):
+        self.n_workers = n_workers
+        self.max_queue = max_queue
+        self.budget = budget
+        self.keep = keep
+        self.ids = itertools.count(1)
+        self.jobs = OrderedDict()
+        self.queue = deque()
+        self.running = 0
+        self.lock = threading.RLock()
+
+        # The cancelled requests and the progress events are shared with the workers through a manager process
+        self.manager = Manager()
+        self.cancelled = self.manager.dict()
+        self.events = self.manager.Queue()
+
+        self.executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                            initargs=(store_dir, cache_dir))
+        wait([self.executor.submit(_warm) for _ in range(n_workers)])
+
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, request):
+        """
+        Queue a request.
+
+        Parameters:
+            request (dict): See solve, budget gives its latency budget in seconds.
+
+        Returns:
+            Job: The request, None if the queue is full.
+        """
+        request = dict(request)
+        request['deadline'] = time.time() + float(request.pop('budget', self.budget))
+
+        with self.lock:
+            if len(self.queue) >= self.max_queue:
+                return None
+
+            job = Job(next(self.ids), request)
+            job.add({'event': 'queued', 'job': job.id, 'position': len(self.queue)})
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep and next(iter(self.jobs.values())).finished:
+                self.jobs.popitem(last=False)
+
+            self.queue.append(job)
+            self._next()
+
+        return job
+
+    def _next(self):
+        # Send the first requests of the queue to the free workers, called with the lock held
+        while self.queue and self.running < self.n_workers:
+            job = self.queue.popleft()
+            self.running += 1
+            job.future = self.executor.submit(solve, job.id, job.request, self.cancelled, self.events)
+            job.future.add_done_callback(lambda future, job=job: self._finish(job, future))
+
+    def cancel(self, id):
+        # Cancel a request, False if it doesn't exist or it has already finished
+        with self.lock:
+            job = self.jobs.get(id)
+            if job is None or job.finished:
+                return False
+
+            if job in self.queue:
+                self.queue.remove(job)
+                job.add({'event': 'cancelled', 'job': job.id}, 'cancelled')
+            else:
+                # A running request is stopped by its worker at its next check of cancelled
+                self.cancelled[id] = True
+
+        return True
+
+    def _finish(self, job, future):
+        with self.lock:
+            self.running -= 1
+            self._next()
+
+        self.cancelled.pop(job.id, None)
+        if future.cancelled():
+            job.add({'event': 'cancelled', 'job': job.id}, 'cancelled')
+            return
+
+        try:
+            job.result = future.result()
+        except Exception as e:
+            job.add({'event': 'failed', 'job': job.id, 'error': repr(e)}, 'failed')
+            return
+
+        status = 'cancelled' if job.result['stop_reason'] == 'cancelled' else 'done'
+        job.add({'event': status, 'job': job.id, 'result': job.result}, status)
+
+    def _dispatch(self):
+        # Move the progress events of the workers to their requests
+        while True:
+            try:
+                id, event = self.events.get()
+            except (EOFError, OSError):
+                return
+
+            job = self.jobs.get(id)
+            if job is not None and not job.finished:
+                job.add(event, 'running' if event['event'] == 'started' else None)
+
+    def status(self):
+        return {'workers': self.n_workers, 'running': self.running, 'queued': len(self.queue),
+                'max_queue': self.max_queue, 'jobs': len(self.jobs)}
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the service, every body is JSON.
+
+        POST /solve           Queue a request and stream its events as JSON lines until the answer, closing the
+                              connection cancels the request.
+        POST /jobs            Queue a request and answer with its id.
+        GET /jobs/<id>        Status of a request and its answer once it has finished.
+        GET /jobs/<id>/events Stream the events of a request as JSON lines until the answer.
+        DELETE /jobs/<id>     Cancel a request.
+        GET /status           Workers and requests pending.
+    """
+
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body):
+        data = json.dumps(body, default=_jsonable).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _closed(self):
+        # The client has closed the connection if its socket is readable but there is nothing to read
+        readable = select.select([self.connection], [], [], 0)[0]
+        try:
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _stream(self, job, cancel_on_close=False):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for event in job.follow(timeout=1.0):
+                if event is None:
+                    if self._closed():
+                        raise ConnectionResetError
+                    continue
+
+                self.wfile.write(json.dumps(event, default=_jsonable).encode() + b'\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            if cancel_on_close:
+                self.service.cancel(job.id)
+
+    def _job(self, path):
+        # Request of a path /jobs/<id>[/events]
+        parts = path.strip('/').split('/')
+        try:
+            return self.service.jobs.get(int(parts[1])), parts[2:]
+        except (IndexError, ValueError):
+            return None, []
+
+    def _submit(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except json.JSONDecodeError as e:
+            self._send(400, {'error': f'Invalid JSON: {e}'})
+            return None
+
+        if not isinstance(request, dict):
+            self._send(400, {'error': 'The request has to be a JSON object'})
+            return None
+
+        if request.get('viaje') is None and request.get('rows') is None:
+            self._send(400, {'error': 'The request needs viaje or rows'})
+            return None
+
+        job = self.service.submit(request)
+        if job is None:
+            self._send(503, {'error': 'The queue is full'})
+
+        return job
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path not in ('/solve', '/jobs'):
+            self._send(404, {'error': f'Unknown path {path}'})
+            return
+
+        job = self._submit()
+        if job is None:
+            return
+
+        if path == '/solve':
+            self._stream(job, cancel_on_close=True)
+        else:
+            self._send(202, {'job': job.id})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/status':
+            self._send(200, self.service.status())
+            return
+
+        job, rest = self._job(path)
+        if job is None or not path.startswith('/jobs/'):
+            self._send(404, {'error': f'Unknown job or path {path}'})
+        elif rest == ['events']:
+            self._stream(job)
+        else:
+            self._send(200, job.summary())
+
+    def do_DELETE(self):
+        job, rest = self._job(urlparse(self.path).path)
+        if job is None:
+            self._send(404, {'error': 'Unknown job'})
+        else:
+            self._send(200, {'job': job.id, 'cancelled': self.service.cancel(job.id)})
+
+def serve(host='127.0.0.1', port=8765, **kwargs):
+    # Start the workers and answer the requests until it is interrupted, kwargs are the parameters of SolveService
+    service = SolveService(**kwargs)
+    handler = type('Handler', (ServiceHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f'Serving on http://{host}:{port} with {service.n_workers} workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Long-running RCH solve service with a warm pool of workers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help='Number of requests solved at the same time')
+    parser.add_argument('--store', default=None, help='TripStore folder, the requests can then give only the trip')
+    parser.add_argument('--cache', default=None, help='Folder of the TripCache')
+    parser.add_argument('--max-queue', type=int, default=32, help='Maximum number of requests waiting')
+    parser.add_argument('--budget', type=float, default=10.0, help='Default latency budget in seconds')
+    args = parser.parse_args(argv)
+
+    serve(args.host, args.port, n_workers=args.workers, store_dir=args.store, cache_dir=args.cache,
+          max_queue=args.max_queue, budget=args.budget)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+from .RCH import preprocess_trip, search, regenerate
+from .archive import SolutionArchive
+from .stopping import StoppingPolicy
+from .loaded import LoadedContainer, state_path
+from .container import MAXI_45
+
+class LoadingSession:
+    """
+    Dynamic loading of a container, the partidas of the trip arrive in batches and each batch is loaded on top of
+    the boxes already in the container.
+
+    Parameters:
+        viaje (str): Trip code.
+        container_dimensions (ContainerSpec): Container that is loaded.
+        stopping (StoppingPolicy): Stopping policy of the restarts of each batch, it is started again for every batch.
+        n_workers (int): Number of worker processes of the restarts.
+        local_search (LocalSearch): Improvement stage after the restarts of each batch, None to skip it.
+        cache (TripCache): Cache of the preprocessed batches.
+        state (LoadedContainer): Boxes already in the container, None for an empty container.
+
+    The first batch of an empty container is loaded with load type 2 (the shortest load) and the next ones with
+    load type 4 on top of the state. The state is kept in memory between batches, so there is no json to read
+    and the previous batches are never loaded again. The boxes of a batch that don't fit are returned by add, they
+    can be sent again with the next batch.
+    """
+
+    def __init__(self, viaje, container_dimensions=MAXI_45, stopping=None, n_workers=1, local_search=None,
+                 cache=None, state=None):
+        self.viaje = viaje
+        self.container_dimensions = container_dimensions
+        self.stopping = stopping if stopping is not None else StoppingPolicy()
+        self.n_workers = n_workers
+        self.local_search = local_search
+        self.cache = cache
+        self.state = state
+
+        # Scores, number of boxes and number of boxes not loaded of each batch
+        self.batches = []
+
+    def add(self, source, seeds=None, recorder=None):
+        """
+        Load a new batch of partidas in the container.
+
+        Parameters:
+            source (str or pd.DataFrame): Input excel or DataFrame with the partidas of the batch.
+            seeds (iterable): Seeds of the restarts of the batch.
+            recorder (Recorder): If given the timers and counters of the restarts are added to it.
+
+        Returns:
+            tuple: Scores (pctg_volume, pctg_floor, x_axis) of the whole container and the dictionary of the boxes
+            of the batch that were not loaded.
+        """
+        load_type = 2 if self.state is None else 4
+
+        df, hmap, table = preprocess_trip(source, self.container_dimensions, self.cache)
+        archive = search(self.container_dimensions, table, hmap, load_type, self.viaje, self.n_workers, seeds,
+                         self.stopping, SolutionArchive(), recorder, self.local_search, self.state)
+
+        # The best solution is generated again and becomes the state the next batch starts from
+        scores, seed = archive.best(load_type)[0]
+        result = regenerate(self.container_dimensions, table, hmap, load_type, self.viaje, seed, self.state)
+        self.state = LoadedContainer.from_result(result)
+        self.batches.append({'scores': scores, 'boxes': len(table), 'not_loaded': len(result[4]),
+                             'restarts': self.stopping.restarts})
+
+        return scores, result[4]
+
+    @property
+    def solution(self):
+        # Boxes loaded so far, the same list of (id, box) as the solutions of RCH
+        return list(self.state.solution) if self.state is not None else []
+
+    def save(self, path=None):
+        # Save the state in the json format of load type 2, soluciones/output_{viaje}.json by default
+        return self.state.to_json(path or state_path(self.viaje))
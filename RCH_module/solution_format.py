@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+# Binary file of a solution and its free PPs (.rchs), the layout is
+#   header: magic, version, boxes, PPs, strings, bytes of the string table
+#   boxes: int16 (boxes, 6) with x, y, z, length, width, height in cm
+#   ids: int32 (boxes, 2) with the positions of Partida and Expedicion in the string table
+#   PPs: int16 (PPs, 6) with x, y, z, l, w, h and uint8 (PPs) with the direction, 0 left and 1 right
+#   strings: int32 (strings + 1) offsets and the utf-8 bytes of the string table
+# Every section starts at a multiple of 8 bytes so the arrays can be memory mapped in place
+MAGIC = b'RCHS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHxxIIII')
+DIRECTIONS = ('left', 'right')
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _coordinates(values, name):
+    # The coordinates are integer cm, a value that doesn't fit exactly in an int16 can't be stored
+    array = np.asarray(values, dtype=np.int64)
+    if array.size and (np.abs(array).max() >= 2**15 or not np.array_equal(array, np.asarray(values))):
+        raise ValueError(f'The {name} have to be integers between -32767 and 32767')
+
+    return array.astype('<i2')
+
+def write_solution(path, solution, PPs):
+    """
+    Write a solution and its free PPs as a binary file.
+
+    Parameters:
+        path (str): Path of the file, .rchs by convention.
+        solution (list): Tuples (id, (x, y, z, length, width, height)) where id is (Partida, Expedicion).
+        PPs (list): Tuples (x, y, z, l, w, h, direction).
+
+    Returns:
+        str: The path.
+    """
+    # Every Partida and Expedicion is stored once in the string table
+    strings = {}
+    ids = []
+    for id, box in solution:
+        if len(id) != 2 or not all(isinstance(x, str) for x in id):
+            raise ValueError(f'The ids have to be (Partida, Expedicion) strings, not {id!r}')
+        ids.append([strings.setdefault(x, len(strings)) for x in id])
+
+    encoded = [x.encode() for x in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i4')
+    offsets[1:] = np.cumsum([len(x) for x in encoded])
+    blob = b''.join(encoded)
+
+    sections = [
+        _coordinates([box[0:6] for id, box in solution], 'boxes').reshape(len(solution), 6),
+        np.asarray(ids, dtype='<i4').reshape(len(solution), 2),
+        _coordinates([pp[0:6] for pp in PPs], 'PPs').reshape(len(PPs), 6),
+        np.array([DIRECTIONS.index(pp[6]) for pp in PPs], dtype=np.uint8),
+        offsets,
+        np.frombuffer(blob, dtype=np.uint8)
+    ]
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(solution), len(PPs), len(encoded), len(blob)))
+        for array in sections:
+            file.write(b'\0' * (_align(file.tell()) - file.tell()))
+            file.write(array.tobytes())
+
+    return path
+
+class SolutionFile:
+    """
+    Read access to a binary solution file written by write_solution.
+
+    Parameters:
+        path (str): Path of the file.
+        mmap (bool): Memory map the file instead of reading it. It only pays off for big files or when only some of
+            the arrays are used.
+
+    The arrays (boxes, ids, pps, directions) are numpy views of the file, solution() and PPs() rebuild the tuples
+    used by the packing step straight from the bytes.
+    """
+
+    # Type and columns of each section in the order they are stored
+    SECTIONS = (('h', 6), ('i', 2), ('h', 6), ('B', 1), ('i', 1), ('B', 1))
+
+    def __init__(self, path, mmap=False):
+        if mmap:
+            self.buffer = memoryview(np.memmap(path, dtype=np.uint8, mode='r'))
+        else:
+            with open(path, 'rb') as file:
+                self.buffer = memoryview(file.read())
+
+        magic, version, n_boxes, n_pps, n_strings, n_bytes = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a solution file')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Solution format version {version} is not supported, convert the json again')
+
+        # Start, end and rows of each section
+        self.path = path
+        self.sections = []
+        offset = HEADER.size
+        for (code, columns), rows in zip(self.SECTIONS, (n_boxes, n_boxes, n_pps, n_pps, n_strings + 1, n_bytes)):
+            offset = _align(offset)
+            size = rows * columns * struct.calcsize(code)
+            self.sections.append((offset, offset + size, rows))
+            offset += size
+
+        start, stop, rows = self.sections[4]
+        offsets = struct.unpack_from(f'<{rows}i', self.buffer, start)
+        blob = self.sections[5][0]
+        self.strings = [str(self.buffer[blob + a:blob + b], 'utf-8') for a, b in zip(offsets, offsets[1:])]
+
+    def _rows(self, section):
+        code, columns = self.SECTIONS[section]
+        start, stop, rows = self.sections[section]
+        return struct.iter_unpack(f'<{columns}{code}', self.buffer[start:stop])
+
+    def _array(self, section):
+        code, columns = self.SECTIONS[section]
+        start, stop, rows = self.sections[section]
+        array = np.frombuffer(self.buffer[start:stop], dtype=f'<{code}')
+        return array.reshape(rows, columns) if columns > 1 else array
+
+    @property
+    def boxes(self):
+        return self._array(0)
+
+    @property
+    def ids(self):
+        return self._array(1)
+
+    @property
+    def pps(self):
+        return self._array(2)
+
+    @property
+    def directions(self):
+        return self._array(3)
+
+    def __len__(self):
+        return self.sections[0][2]
+
+    def solution(self):
+        strings = self.strings
+        return [((strings[a], strings[b]), box) for (a, b), box in zip(self._rows(1), self._rows(0))]
+
+    def PPs(self):
+        return [pp + (DIRECTIONS[d],) for pp, (d,) in zip(self._rows(2), self._rows(3))]
+
+def read_solution(path, mmap=False):
+    # Returns the solution and the PPs as lists of tuples, the same as RCH
+    file = SolutionFile(path, mmap)
+    return file.solution(), file.PPs()
+
+def json_to_binary(source, destination=None):
+    # Convert a soluciones/output_{viaje}.json file, by default the binary file is written next to it
+    with open(source, 'r') as file:
+        loaded_output = json.load(file)
+
+    solution = [(tuple(id), tuple(box)) for id, box in loaded_output['solution']]
+    destination = destination or os.path.splitext(source)[0] + '.rchs'
+
+    return write_solution(destination, solution, loaded_output['PPs'])
+
+def binary_to_json(source, destination=None):
+    # Convert a binary file back to the json format written by load type 2
+    solution, PPs = read_solution(source)
+    destination = destination or os.path.splitext(source)[0] + '.json'
+
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    with open(destination, 'w') as file:
+        json.dump({'solution': solution, 'PPs': PPs}, file)
+
+    return destination
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert saved solutions between json and the binary format')
+    parser.add_argument('direction', choices=['to-binary', 'to-json'])
+    parser.add_argument('files', nargs='+', help='Files to convert, each one is written next to the original')
+    args = parser.parse_args()
+
+    convert = json_to_binary if args.direction == 'to-binary' else binary_to_json
+    for path in args.files:
+        print(convert(path))
@@ -1,33 +1,31 @@
-import random as random
-def sort_boxes(boxes):
-    # First step is to do a simple sorting of the boxes, we sort first by priority box[3] and then by volume 
-    sorted_boxes = dict(sorted(boxes.items(), key=lambda x: (x[1][2], x[1][0]), reverse=True))
-    final_order = {}
+import numpy as np
 
-    # Second step is adding some randomization to the order, if two boxes next to each other in the order have a similar enough
-    # order then with a probability of 0.5 we swap them
-    sorted_list = list(sorted_boxes.items())
+def orient_boxes(table, container_width, draws):
+    # Boxes without a fixed orientation are rotated with a probability of 0.5, draws has one random number per box
+    rotated = (table.fixed == 2) | ((table.fixed == 0) & (draws < 0.5))
+    length = np.where(rotated, table.width, table.length)
+    width = np.where(rotated, table.length, table.width)
 
-    for i in range(0,len(sorted_list),2):
-        j = i+1
+    return length, width, box_priority(width, container_width)
 
-        if j < len(sorted_boxes):
-            vol1 = sorted_list[i][1][0] * sorted_list[i][1][1] * sorted_list[i][1][2]
-            vol2 = sorted_list[j][1][0] * sorted_list[j][1][1] * sorted_list[j][1][2]
-            prio1 = sorted_list[i][1][3]
-            prio2 = sorted_list[j][1][3]
-            r = random.random()
+def box_priority(width, container_width):
+    # If the box fills the container width we give it priority 1
+    return np.where(container_width - width < 15, 1, 2)
 
-            # Check if the ratio of volumes is within 30% and the a probability of 0.5
-            if 0.7 <= vol1/vol2 and vol1/vol2 <= 1.3 and r < 0.7 and prio1 == prio2:
-                final_order[sorted_list[j][0]] = sorted_list[j][1]
-                final_order[sorted_list[i][0]] = sorted_list[i][1]
+def sort_table(table, length, priority, draws):
+    # Order of the boxes of the compiled table, first we sort by height and then by length, boxes that are equal
+    # keep the order of the table
+    order = np.argsort(-(table.height_key + length), kind='stable')
 
-            else:
-                final_order[sorted_list[i][0]] = sorted_list[i][1]
-                final_order[sorted_list[j][0]] = sorted_list[j][1]
-        else:
-            final_order[sorted_list[i][0]] = sorted_list[i][1]
-    
-    # Return the final order of the boxes after sorting and swapping
-    return final_order
\ No newline at end of file
+    # Adjacent boxes with a similar volume and the same priority are swapped with a probability of 0.7,
+    # draws has one random number per pair of boxes
+    first = order[0:len(order) - 1:2].copy()
+    second = order[1::2].copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = table.volume[first] / table.volume[second]
+    swap = (0.7 <= ratio) & (ratio <= 1.3) & (draws < 0.7) & (priority[first] == priority[second])
+
+    order[0:len(order) - 1:2] = np.where(swap, second, first)
+    order[1::2] = np.where(swap, first, second)
+
+    return order
@@ -0,0 +1,107 @@
+import time
+
+def objective(load_type):
+    # Key used to rank the scores (pctg_volume, pctg_floor, x_axis) of a solution, a bigger key is a better solution
+    #   1. Maximize volume and then floor
+    #   2. Minimize X axis and then maximize floor
+    #   3. Maximize floor and then volume
+    #   4. Same as 2, the resumed load should be as short as possible
+    if load_type == 3:
+        return lambda x: (x[1], x[0])
+    elif load_type in (2, 4):
+        return lambda x: (-x[2], x[1])
+
+    return lambda x: (x[0], x[1])
+
+class StoppingPolicy:
+    """
+    Decide when the restart loop of get_volumes stops.
+
+    Parameters:
+        max_restarts (int): Maximum number of restarts, None for no limit.
+        time_budget (float): Wall-clock budget in seconds, None for no limit.
+        patience (int): Stop after this many restarts without improving the objective of the load type, None to disable.
+        distinct (bool): Only count the restarts that are not duplicates of a previous one for max_restarts. As the
+            number of distinct restarts of a small trip can be less than max_restarts, the loop also stops after
+            max_duplicates duplicates in a row.
+        max_duplicates (int): Duplicates in a row that stop the loop when distinct is True.
+
+    A fraction of the time budget can be reserved for a stage after the restarts (the local search), the restarts
+    then stop when the rest of the budget is used and remaining() gives the seconds left for that stage.
+
+    After the loop, stop_reason holds why it stopped ('max_restarts', 'time_budget', 'no_improvement', 'duplicates'
+    or 'seeds' if the seeds ran out first), restarts holds the number of restarts actually used and duplicates how
+    many of them were duplicates.
+    """
+
+    def __init__(self, max_restarts=15000, time_budget=None, patience=None, distinct=False, max_duplicates=1000):
+        if max_restarts is None and time_budget is None and patience is None:
+            raise ValueError('At least one of max_restarts, time_budget or patience has to be set')
+
+        self.max_restarts = max_restarts
+        self.time_budget = time_budget
+        self.patience = patience
+        self.distinct = distinct
+        self.max_duplicates = max_duplicates
+        self.start(1)
+
+    def start(self, load_type, reserve=0.0):
+        # Reset the state so the same policy can be used for several trips
+        self.key = objective(load_type)
+        self.reserve = reserve
+        self.start_time = time.perf_counter()
+        self.elapsed = 0
+        self.restarts = 0
+        self.duplicates = 0
+        self.duplicates_in_row = 0
+        self.best = None
+        self.since_improvement = 0
+        self.stop_reason = None
+
+    def update(self, scores, duplicate=False):
+        # Register the scores of a finished restart and return True if the loop has to stop
+        self.restarts += 1
+        self.elapsed = time.perf_counter() - self.start_time
+
+        if duplicate:
+            self.duplicates += 1
+            self.duplicates_in_row += 1
+        else:
+            self.duplicates_in_row = 0
+        counted = self.restarts - self.duplicates if self.distinct else self.restarts
+
+        key = self.key(scores)
+        if self.best is None or key > self.best:
+            self.best = key
+            self.since_improvement = 0
+        else:
+            self.since_improvement += 1
+
+        if self.max_restarts is not None and counted >= self.max_restarts:
+            self.stop_reason = 'max_restarts'
+        elif self.time_budget is not None and self.elapsed >= self.time_budget * (1 - self.reserve):
+            self.stop_reason = 'time_budget'
+        elif self.patience is not None and self.since_improvement >= self.patience:
+            self.stop_reason = 'no_improvement'
+        elif self.distinct and self.max_duplicates is not None and self.duplicates_in_row >= self.max_duplicates:
+            self.stop_reason = 'duplicates'
+
+        return self.stop_reason is not None
+
+    @property
+    def duplicate_rate(self):
+        # Fraction of the restarts that were duplicates, the hit rate of the memo
+        return self.duplicates / self.restarts if self.restarts else 0.0
+
+    def remaining(self):
+        # Seconds left of the time budget, None if there is no time budget
+        if self.time_budget is None:
+            return None
+
+        return self.time_budget - (time.perf_counter() - self.start_time)
+
+    def finish(self):
+        # If the loop ended without the policy stopping it, it is because there were no seeds left
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.stop_reason is None:
+            self.stop_reason = 'seeds'
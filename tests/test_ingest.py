@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from RCH_module.ingest import fetch_trips, partidas_query
+
+# Rows of the view (trip, partida, expedicion, length, width, height, kg, type), not sorted by trip
+ROWS = [
+    ('PMI', 'P3', 'E1', 120, 80, 100, 300, 'Palet'),
+    ('MAH', 'P1', 'E2', 120, 100, 150, 500, 'Palet'),
+    ('PMI', 'P1', 'E1', 120, 80, 90, 250, 'Palet'),
+    ('IBZ', 'P2', 'E3', 100, 100, 120, 400, 'Palet'),
+    ('PMI', 'P2', 'E1', 80, 60, 50, 40, 'Caja'),
+    ('MAH', 'P4', 'E2', 120, 80, 110, 320, 'Palet'),
+    ('IBZ', 'P1', 'E3', 120, 80, 140, 380, 'Palet'),
+]
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE partidas (ExpedicionDestino TEXT, PartidaCodigoPartida TEXT, '
+                       'ExpedicionCodigo TEXT, PartidaLargo INTEGER, PartidaAncho INTEGER, PartidaAlto INTEGER, '
+                       'PartidaKg INTEGER, PartidaTipo TEXT)')
+    connection.executemany('INSERT INTO partidas VALUES (?, ?, ?, ?, ?, ?, ?, ?)', ROWS)
+    yield connection
+    connection.close()
+
+def _read(connection, **kwargs):
+    return [(trip, df) for trip, df in fetch_trips(connection, filters={}, view='partidas', **kwargs)]
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5000])
+def test_fetch_trips_chunks(connection, chunk_size):
+    # The trips come whole and in order whatever the size of the chunks, even when a trip spans several chunks
+    trips = _read(connection, chunk_size=chunk_size)
+
+    assert [trip for trip, df in trips] == ['IBZ', 'MAH', 'PMI']
+    assert [list(df['Partida']) for trip, df in trips] == [['P1', 'P2'], ['P1', 'P4'], ['P1', 'P2', 'P3']]
+    for trip, df in trips:
+        assert (df['CodigoViaje'] == trip).all()
+        assert list(df.index) == list(range(len(df)))
+        assert (df['Volumen'] == df['LargoCm'] * df['AnchoCm'] * df['AltoCm']).all()
+
+def test_fetch_trips_filters(connection):
+    # The filters are done by the query, a list gives several values of a column
+    filters = {'PartidaTipo': 'Palet', 'ExpedicionDestino': ['PMI', 'MAH']}
+    trips = list(fetch_trips(connection, filters, view='partidas', chunk_size=2))
+
+    assert [trip for trip, df in trips] == ['MAH', 'PMI']
+    assert list(trips[1][1]['Partida']) == ['P1', 'P3']
+
+def test_fetch_trips_order_column(connection):
+    # The partidas of a trip are sorted by order_column
+    trips = dict(_read(connection, order_column='PartidaAlto', chunk_size=2))
+
+    assert list(trips['PMI']['AltoCm']) == [50, 90, 100]
+
+def test_partidas_query_identifiers():
+    with pytest.raises(ValueError):
+        partidas_query(order_column='PartidaCodigoPartida; DROP TABLE partidas')
+    with pytest.raises(ValueError):
+        partidas_query(trip_column='1 OR 1=1')